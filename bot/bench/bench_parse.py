@@ -0,0 +1,174 @@
+"""Compare the legacy dict parser with quotes.parse_flight on SerpApi-shaped bodies.
+
+The response bodies are synthetic: they follow the google_flights
+response layout (best_flights/other_flights with legs, layovers, carbon
+emissions, booking tokens, price_insights) but the values are generated,
+not captured from SerpApi. Each run reports CPU time per parsed quote and
+the memory held by 10,000 cached quotes of each kind (via tracemalloc).
+"FlightQuote+3" also keeps three alternative itineraries per quote, as
+flights.py does by default.
+
+Usage:
+    python bench/bench_parse.py [--flights 20] [--runs 2000] [--held 10000]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from quotes import parse_flight  # noqa: E402
+
+AIRLINES = ["ANA", "Japan Airlines", "Delta", "United", "Alaska", "Korean Air", "Air Canada"]
+HUBS = ["SEA", "SFO", "LAX", "YVR", "ICN", "HND"]
+
+
+def synthetic_response(flights, rnd):
+    """A body shaped like a SerpApi google_flights response."""
+    def itinerary():
+        stops = rnd.choice([0, 0, 1, 1, 2])
+        legs = []
+        for _ in range(stops + 1):
+            legs.append({
+                "departure_airport": {"name": "Departure Airport", "id": rnd.choice(HUBS), "time": "2026-06-15 10:30"},
+                "arrival_airport": {"name": "Arrival Airport", "id": rnd.choice(HUBS), "time": "2026-06-16 14:05"},
+                "duration": rnd.randint(90, 660),
+                "airplane": "Boeing 787",
+                "airline": rnd.choice(AIRLINES),
+                "airline_logo": "https://www.gstatic.com/flights/airline_logos/70px/NH.png",
+                "travel_class": "Economy",
+                "flight_number": f"NH {rnd.randint(1, 999)}",
+                "legroom": "31 in",
+                "extensions": ["Average legroom (31 in)", "Wi-Fi for a fee", "In-seat power & USB outlets"],
+                "often_delayed_by_over_30_min": False,
+            })
+        return {
+            "flights": legs,
+            "layovers": [{"duration": rnd.randint(45, 300), "name": "Layover", "id": rnd.choice(HUBS)} for _ in range(stops)],
+            "total_duration": sum(leg["duration"] for leg in legs),
+            "carbon_emissions": {"this_flight": 612000, "typical_for_this_route": 640000, "difference_percent": -4},
+            "price": rnd.randint(350, 1800),
+            "type": "One way",
+            "airline_logo": "https://www.gstatic.com/flights/airline_logos/70px/multi.png",
+            "booking_token": "".join(rnd.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", k=400)),
+        }
+
+    return json.dumps({
+        "search_metadata": {"id": "synthetic", "status": "Success", "total_time_taken": 1.2},
+        "search_parameters": {"engine": "google_flights", "departure_id": "SEA", "arrival_id": "NRT", "type": "2"},
+        "best_flights": [itinerary() for _ in range(min(3, flights))],
+        "other_flights": [itinerary() for _ in range(max(flights - 3, 0))],
+        "price_insights": {
+            "lowest_price": 512, "price_level": "typical", "typical_price_range": [480, 900],
+            "price_history": [[1700000000 + i * 86400, rnd.randint(450, 950)] for i in range(60)],
+        },
+        "airports": [{"departure": [{"airport": {"id": "SEA", "name": "Seattle-Tacoma"}}],
+                      "arrival": [{"airport": {"id": "NRT", "name": "Narita"}}]}],
+    }).encode()
+
+
+def legacy_parse_flight(data, origin, destination, departure_date, currency="USD"):
+    """The dict parser flights.py used before FlightQuote, kept as the baseline."""
+    flights = data.get("best_flights", []) or data.get("other_flights", [])
+
+    if not flights:
+        return None
+
+    flight = flights[0]
+    price = flight.get("price")
+
+    if not price:
+        return None
+
+    legs = flight.get("flights", [])
+    airline = "Unknown"
+    departure_time = ""
+    arrival_time = ""
+    stops = len(legs) - 1 if legs else 0
+
+    if legs:
+        first_leg = legs[0]
+        airline = first_leg.get("airline", "Unknown")
+        departure_time = first_leg.get("departure_airport", {}).get("time", "")
+
+        last_leg = legs[-1]
+        arrival_time = last_leg.get("arrival_airport", {}).get("time", "")
+
+    duration = flight.get("total_duration", 0)
+    hours = duration // 60
+    mins = duration % 60
+    duration_str = f"{hours}h {mins}m" if duration else ""
+
+    booking_link = f"https://www.google.com/travel/flights?q=one%20way%20flights%20from%20{origin}%20to%20{destination}%20on%20{departure_date}&curr={currency}"
+
+    return {
+        "price": float(price),
+        "airline": airline,
+        "departure_time": departure_time,
+        "arrival_time": arrival_time,
+        "duration": duration_str,
+        "stops": stops,
+        "link": booking_link
+    }
+
+
+def legacy(body):
+    return legacy_parse_flight(json.loads(body), "SEA", "NRT", "2026-06-15")
+
+
+def typed(body):
+    return parse_flight(body, "SEA", "NRT", "2026-06-15", alternatives=0)
+
+
+def typed_with_alternatives(body):
+    return parse_flight(body, "SEA", "NRT", "2026-06-15", alternatives=3)
+
+
+def time_parser(fn, bodies, runs):
+    start = time.process_time()
+    for i in range(runs):
+        fn(bodies[i % len(bodies)])
+    return (time.process_time() - start) / runs * 1e6
+
+
+def held_memory(fn, bodies, count):
+    """Bytes retained by `count` parsed quotes, as if kept in the quote cache."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [fn(bodies[i % len(bodies)]) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flights", type=int, default=20, help="itineraries per response")
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--held", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    bodies = [synthetic_response(args.flights, rnd) for _ in range(50)]
+    print(f"{len(bodies)} synthetic bodies, {sum(map(len, bodies)) // len(bodies):,} bytes each on average")
+
+    parsers = (
+        ("legacy dict", legacy),
+        ("FlightQuote", typed),
+        ("FlightQuote+3", typed_with_alternatives),
+    )
+    for label, fn in parsers:
+        per_quote = time_parser(fn, bodies, args.runs)
+        held = held_memory(fn, bodies, args.held)
+        print(f"{label:14} {per_quote:8.1f} us/quote CPU   {held / args.held:8.0f} B/quote held "
+              f"({held / 1024 / 1024:.1f} MiB for {args.held:,})")
+
+
+if __name__ == "__main__":
+    main()
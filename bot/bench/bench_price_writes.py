@@ -0,0 +1,82 @@
+"""Benchmark sweep result persistence: per-alert writes vs batched writes.
+
+Seeds throwaway alerts in the database at DATABASE_URL, records one price
+per alert with update_last_price (one UPDATE + INSERT per alert) and then
+with bulk_update_last_prices, and reports rows/second for each. The seeded
+rows are removed afterwards.
+
+Usage: DATABASE_URL=postgresql://... python bench/bench_price_writes.py [alerts] [batch_size]
+"""
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import db  # noqa: E402
+
+
+def seed(count):
+    user_id = db.new_id()
+    alert_ids = [db.new_id() for _ in range(count)]
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO "User" (id, name, email) VALUES (%s, %s, %s)',
+            (user_id, "bench:price-writes", f"bench_{user_id}@trackroth.local")
+        )
+        execute_values(cursor, '''
+            INSERT INTO "Alert" (id, "userId", origin, destination, "departureDate", "isActive", "createdAt", "updatedAt")
+            VALUES %s
+        ''', [(alert_id, user_id) for alert_id in alert_ids],
+            template="(%s, %s, 'SEA', 'NRT', CURRENT_DATE + 30, true, NOW(), NOW())", page_size=1000)
+    return user_id, alert_ids
+
+
+def cleanup(user_id, alert_ids):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM "PriceHistory" WHERE "alertId" = ANY(%s)', (alert_ids,))
+        cursor.execute('DELETE FROM "Alert" WHERE "userId" = %s', (user_id,))
+        cursor.execute('DELETE FROM "User" WHERE id = %s', (user_id,))
+
+
+def bench_per_row(rows, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda row: db.update_last_price.sync(*row), rows))
+    return time.perf_counter() - start
+
+
+def bench_batched(rows, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        db.bulk_update_last_prices.sync(rows[i:i + batch_size])
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else db.DB_WRITE_BATCH_SIZE
+
+    user_id, alert_ids = seed(count)
+    try:
+        rows = [(alert_id, round(random.uniform(200, 1200), 2)) for alert_id in alert_ids]
+
+        elapsed = bench_per_row(rows, db.DB_POOL_MAX)
+        print(f"per-alert writes ({db.DB_POOL_MAX} threads): {count} rows in {elapsed:.2f}s = {count / elapsed:,.0f} rows/s")
+
+        elapsed = bench_batched(rows, batch_size)
+        print(f"batched writes (batch {batch_size}):      {count} rows in {elapsed:.2f}s = {count / elapsed:,.0f} rows/s")
+        print(f"pool: {db.pool_stats()}")
+    finally:
+        cleanup(user_id, alert_ids)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Seed a large dataset and measure the bot's hot queries with and without indexes.
+
+Creates a `bench` schema in the database at DATABASE_URL with copies of
+the "User", "Alert" and "PriceHistory" tables (public data is not
+touched). It fills them with synthetic rows and runs each hot query from
+db.py. Each query is timed first without indexes, then again after
+applying prisma/sql/bot_indexes.sql. The report shows median latency
+and the plan node types from EXPLAIN ANALYZE.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/trackroth python bench/bench_queries.py \
+        [--alerts 1000000] [--history 50000000] [--users 100000] [--runs 20] [--keep]
+
+Seeding the default 50M history rows takes a while and several GB of disk.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from urllib.parse import urlparse
+
+import psycopg2
+
+INDEX_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "prisma", "sql", "bot_indexes.sql")
+CHUNK = 5_000_000
+
+# (label, SQL, params factory) — mirrors the queries in db.py
+QUERIES = [
+    ("get_or_create_user", 'SELECT * FROM "User" WHERE "discordId" = %s',
+     lambda rnd: (str(rnd(1, USERS)),)),
+    ("get_user_alerts", '''
+        SELECT * FROM "Alert" WHERE "userId" = %s AND "isActive" = true ORDER BY "createdAt" DESC
+     ''', lambda rnd: (f"u{rnd(1, USERS)}",)),
+    ("get_user_alerts_page", '''
+        SELECT * FROM "Alert"
+        WHERE "userId" = %s AND "isActive" = true AND "departureDate" >= CURRENT_DATE
+        ORDER BY "createdAt" DESC, id DESC LIMIT 10
+     ''', lambda rnd: (f"u{rnd(1, USERS)}",)),
+    ("find_user_alerts", '''
+        SELECT * FROM "Alert" WHERE "userId" = %s AND "isActive" = true AND id LIKE %s ORDER BY id LIMIT 2
+     ''', lambda rnd: (f"u{rnd(1, USERS)}", f"a{rnd(1, 9)}%")),
+    ("deactivate_expired_alerts (select)", '''
+        SELECT id FROM "Alert" WHERE "isActive" = true AND "departureDate" < CURRENT_DATE LIMIT 5000
+     ''', lambda rnd: ()),
+    ("get_active_alerts_page", '''
+        SELECT a.id, a.origin, a.destination, a."departureDate", a."maxPrice", a."lastPrice", u.name, u."discordId"
+        FROM "Alert" a JOIN "User" u ON a."userId" = u.id
+        WHERE a."isActive" = true AND a."departureDate" >= CURRENT_DATE AND a.id > %s
+        ORDER BY a.id LIMIT 5000
+     ''', lambda rnd: (f"a{rnd(1, ALERTS)}",)),
+    ("claim_due_alerts (select)", '''
+        SELECT id FROM "Alert"
+        WHERE "isActive" = true AND "departureDate" >= CURRENT_DATE
+          AND ("nextCheckAt" IS NULL OR "nextCheckAt" <= NOW())
+          AND ("leaseExpiresAt" IS NULL OR "leaseExpiresAt" < NOW())
+        ORDER BY "nextCheckAt" NULLS FIRST LIMIT 100
+     ''', lambda rnd: ()),
+    ("alert price history", '''
+        SELECT price, "checkedAt" FROM "PriceHistory" WHERE "alertId" = %s ORDER BY "checkedAt"
+     ''', lambda rnd: (f"a{rnd(1, ALERTS)}",)),
+]
+
+USERS = ALERTS = 0
+
+
+def connect():
+    db_url = urlparse(os.environ["DATABASE_URL"])
+    conn = psycopg2.connect(
+        host=db_url.hostname,
+        port=db_url.port,
+        user=db_url.username,
+        password=db_url.password,
+        database=db_url.path[1:],
+    )
+    conn.autocommit = True
+    return conn
+
+
+def seed(cursor, users, alerts, history):
+    cursor.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+    cursor.execute("CREATE SCHEMA bench")
+    cursor.execute("SET search_path TO bench")
+    for table in ("User", "Alert", "PriceHistory"):
+        cursor.execute(f'CREATE TABLE "{table}" (LIKE public."{table}" INCLUDING DEFAULTS)')
+
+    start = time.perf_counter()
+    cursor.execute('''
+        INSERT INTO "User" (id, name, email, "discordId", "createdAt")
+        SELECT 'u' || i, 'discord:' || i, 'discord_' || i || '@trackroth.local', i::text, NOW()
+        FROM generate_series(1, %s) i
+    ''', (users,))
+    cursor.execute('''
+        INSERT INTO "Alert" (id, "userId", origin, destination, "departureDate", "maxPrice", "lastPrice",
+                             "isActive", "createdAt", "updatedAt", "nextCheckAt")
+        SELECT 'a' || i, 'u' || (1 + (random() * (%s - 1))::int),
+               (ARRAY['SEA','PDX','SFO','LAX','JFK'])[1 + (i %% 5)],
+               (ARRAY['NRT','HND','KIX','LHR','CDG','ICN'])[1 + (i %% 6)],
+               CURRENT_DATE + (random() * 365)::int, 500 + random() * 500, 400 + random() * 800,
+               random() < 0.9, NOW() - random() * INTERVAL '180 days', NOW(),
+               NOW() + (random() * 2 - 1) * INTERVAL '12 hours'
+        FROM generate_series(1, %s) i
+    ''', (users, alerts))
+    print(f"seeded {users:,} users and {alerts:,} alerts in {time.perf_counter() - start:.1f}s", flush=True)
+
+    for offset in range(0, history, CHUNK):
+        count = min(CHUNK, history - offset)
+        start = time.perf_counter()
+        cursor.execute('''
+            INSERT INTO "PriceHistory" (id, "alertId", price, "checkedAt")
+            SELECT 'h' || i, 'a' || (1 + (random() * (%s - 1))::int), 300 + random() * 900,
+                   NOW() - random() * INTERVAL '90 days'
+            FROM generate_series(%s, %s) i
+        ''', (alerts, offset + 1, offset + count))
+        print(f"seeded history rows {offset + count:,}/{history:,} ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    for table in ("User", "Alert", "PriceHistory"):
+        cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id)')
+        cursor.execute(f'ANALYZE "{table}"')
+
+
+def plan_nodes(plan):
+    nodes = [plan["Node Type"] + (f" on {plan['Index Name']}" if "Index Name" in plan else "")]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def measure(cursor, runs):
+    rnd = random.Random(42).randint
+    results = {}
+    for label, sql, params in QUERIES:
+        timings = []
+        for _ in range(runs):
+            args = params(rnd)
+            start = time.perf_counter()
+            cursor.execute(sql, args)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params(rnd))
+        plan = cursor.fetchone()[0][0]["Plan"]
+        results[label] = (statistics.median(timings), max(timings), plan_nodes(plan))
+    return results
+
+
+def report(title, results):
+    print(f"\n== {title} ==")
+    for label, (median, worst, nodes) in results.items():
+        print(f"{label:36} median {median:9.2f} ms   max {worst:9.2f} ms   {' > '.join(nodes[:4])}")
+
+
+def main():
+    global USERS, ALERTS
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--alerts", type=int, default=1_000_000)
+    parser.add_argument("--history", type=int, default=50_000_000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="keep the bench schema afterwards")
+    args = parser.parse_args()
+    USERS, ALERTS = args.users, args.alerts
+
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        seed(cursor, args.users, args.alerts, args.history)
+        report("without indexes", measure(cursor, args.runs))
+
+        start = time.perf_counter()
+        with open(INDEX_FILE) as f:
+            cursor.execute(f.read())
+        print(f"\napplied {os.path.basename(INDEX_FILE)} in {time.perf_counter() - start:.1f}s")
+        report("with indexes", measure(cursor, args.runs))
+    finally:
+        if not args.keep:
+            cursor.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""In-memory stand-ins for the parts of discord.py the bot's commands and notifier use."""
+import itertools
+
+_ids = itertools.count(1)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.edits = 0
+
+    async def edit(self, content=None, embed=None):
+        self.edits += 1
+        self.content = content if content is not None else self.content
+        self.embed = embed if embed is not None else self.embed
+        return self
+
+
+class FakeChannel:
+    """Records messages instead of sending them."""
+
+    def __init__(self):
+        self.id = next(_ids)
+        self.messages = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        message = FakeMessage(self, content, embed)
+        self.messages.append(message)
+        return message
+
+
+class FakeUser(FakeChannel):
+    """A Discord user; send() is a DM."""
+
+    def __init__(self, user_id, name=None):
+        super().__init__()
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeContext:
+    """The subset of commands.Context used by the bot's commands."""
+
+    def __init__(self, author, guild=None):
+        self.author = author
+        self.guild = guild
+        self.channel = FakeChannel()
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return await self.channel.send(content, embed=embed, **kwargs)
+
+    @property
+    def messages(self):
+        return self.channel.messages
+
+
+class FakeBot:
+    """User lookups for NotificationDispatcher; every user exists and accepts DMs."""
+
+    def __init__(self):
+        self.users = {}
+        self.fetches = 0
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        self.fetches += 1
+        return self.users.setdefault(user_id, FakeUser(user_id))
+
+    def dms(self):
+        return sum(len(user.messages) for user in self.users.values())
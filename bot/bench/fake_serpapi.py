@@ -0,0 +1,201 @@
+"""Local stand-in for the SerpApi google_flights and account endpoints.
+
+Responses follow the google_flights layout, but every value is generated.
+Each (origin, destination, date) gets a stable base price. Every request
+adds jitter around it, so repeated sweeps see prices rise and fall. The
+latency, error rate and price spread are configurable. Point the bot at
+it with SERPAPI_URL=http://127.0.0.1:<port>/search.
+
+Comma-separated departure_id/arrival_id lists are answered like grouped
+Google Flights searches. Itineraries for every pair are mixed in one
+response, and `coverage` drops a share of the pairs entirely. With
+--record DIR every body served is saved as
+<departure_id>_<arrival_id>_<date>.json. With --replay DIR, files of that
+name (e.g. saved real SerpApi responses) are served instead of generated
+ones.
+
+Usage:
+    python bench/fake_serpapi.py [--port 8765] [--latency-ms 800] [--error-rate 0.01] \
+        [--coverage 0.8] [--record DIR | --replay DIR]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import zlib
+
+from aiohttp import web
+
+AIRLINES = ["ANA", "Japan Airlines", "Delta", "United", "Alaska", "Korean Air", "Air Canada"]
+
+
+class FakeSerpApi:
+    """aiohttp app answering /search and /account.json like SerpApi.
+
+    `latency_ms` is the median of a log-normal delay. `error_rate` is split
+    between HTTP 500s and 200s with an "error" body, both of which SerpApi
+    returns in practice. `coverage` is the share of airport pairs a grouped
+    (comma-list) search has itineraries for. Counters record what the bot
+    asked for.
+    """
+
+    def __init__(self, latency_ms=800, error_rate=0.0, price_median=700, price_spread=0.35,
+                 jitter=0.08, flights=12, seed=42, coverage=1.0, record_dir=None, replay_dir=None):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.price_median = price_median
+        self.price_spread = price_spread
+        self.jitter = jitter
+        self.flights = flights
+        self.coverage = coverage
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.grouped_calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.routes = set()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/search", self.search)
+        app.router.add_get("/search.json", self.search)
+        app.router.add_get("/account.json", self.account)
+        return app
+
+    def base_price(self, origin, destination, date):
+        # Stable per route and date, log-normally spread around the median
+        rnd = random.Random(zlib.crc32(f"{origin}{destination}{date}".encode()))
+        return self.price_median * rnd.lognormvariate(0, self.price_spread)
+
+    def covers(self, origin, destination, date):
+        # Stable per pair and date, so a replayed run drops the same pairs
+        return zlib.crc32(f"cover{origin}{destination}{date}".encode()) % 1000 < self.coverage * 1000
+
+    def itinerary(self, origin, destination, date, rank):
+        stops = self.random.choice([0, 1, 1, 2])
+        airports = [origin] + [f"HB{i}" for i in range(1, stops + 1)] + [destination]
+        legs = [{
+            "departure_airport": {"id": airports[i], "time": f"{date} {8 + rank % 12:02d}:15"},
+            "arrival_airport": {"id": airports[i + 1], "time": f"{date} {20 - rank % 6:02d}:40"},
+            "duration": self.random.randint(90, 660),
+            "airline": self.random.choice(AIRLINES),
+            "travel_class": "Economy",
+            "flight_number": f"XX {self.random.randint(1, 999)}",
+        } for i in range(stops + 1)]
+        price = self.base_price(origin, destination, date) * (1 + rank * 0.06)
+        price *= self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        return {
+            "flights": legs,
+            "layovers": [{"duration": self.random.randint(45, 300), "id": airport} for airport in airports[1:-1]],
+            "total_duration": sum(leg["duration"] for leg in legs),
+            "price": round(price),
+            "type": "One way",
+            "booking_token": f"fake-{zlib.crc32(repr(legs).encode()):x}",
+        }
+
+    def body(self, departure_id, arrival_id, date):
+        origins, destinations = departure_id.split(","), arrival_id.split(",")
+        pairs = [(o, d) for o in origins for d in destinations]
+        if len(pairs) > 1:
+            pairs = [pair for pair in pairs if self.covers(*pair, date)]
+
+        # A grouped search shares one result list between its pairs, cheapest first
+        per_pair = max(self.flights // max(len(pairs), 1), 1)
+        itineraries = [self.itinerary(o, d, date, rank) for o, d in pairs for rank in range(per_pair)]
+        if len(pairs) > 1:
+            itineraries.sort(key=lambda i: i["price"])
+        if not itineraries:
+            return {"error": "Google Flights hasn't returned any results for this query."}
+
+        return {
+            "search_metadata": {"status": "Success"},
+            "search_parameters": {"engine": "google_flights", "departure_id": departure_id, "arrival_id": arrival_id},
+            "best_flights": itineraries[:3],
+            "other_flights": itineraries[3:],
+            "price_insights": {"lowest_price": min(i["price"] for i in itineraries), "price_level": "typical"},
+        }
+
+    async def search(self, request):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            query = request.query
+            origin, destination, date = query.get("departure_id"), query.get("arrival_id"), query.get("outbound_date")
+            self.routes.add((origin, destination, date))
+            if "," in origin or "," in destination:
+                self.grouped_calls += 1
+
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000 * self.random.lognormvariate(0, 0.5))
+
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                if self.random.random() < 0.5:
+                    return web.json_response({"error": "Internal server error"}, status=500)
+                return web.json_response({"error": "Google Flights hasn't returned any results for this query."})
+
+            name = f"{origin}_{destination}_{date}.json"
+            if self.replay_dir and os.path.exists(os.path.join(self.replay_dir, name)):
+                with open(os.path.join(self.replay_dir, name), "rb") as f:
+                    body = f.read()
+            else:
+                body = json.dumps(self.body(origin, destination, date)).encode()
+            if self.record_dir:
+                with open(os.path.join(self.record_dir, name), "wb") as f:
+                    f.write(body)
+            return web.Response(body=body, content_type="application/json")
+        finally:
+            self.in_flight -= 1
+
+    async def account(self, request):
+        return web.json_response({"searches_per_month": 10_000_000, "this_month_usage": 0})
+
+    def reset(self):
+        self.calls = self.grouped_calls = self.errors = self.max_in_flight = 0
+        self.routes = set()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "grouped_calls": self.grouped_calls,
+            "errors": self.errors,
+            "distinct_routes": len(self.routes),
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+async def start(server, port=0):
+    """Serve `server` on 127.0.0.1. Returns (runner, base URL)."""
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--price-median", type=float, default=700)
+    parser.add_argument("--flights", type=int, default=12, help="itineraries per response")
+    parser.add_argument("--coverage", type=float, default=1.0, help="share of pairs a grouped search returns")
+    parser.add_argument("--record", metavar="DIR", help="save every body served to DIR")
+    parser.add_argument("--replay", metavar="DIR", help="serve saved bodies from DIR when present")
+    args = parser.parse_args()
+
+    server = FakeSerpApi(args.latency_ms, args.error_rate, args.price_median, flights=args.flights,
+                         coverage=args.coverage, record_dir=args.record, replay_dir=args.replay)
+    print(f"Fake SerpApi on http://127.0.0.1:{args.port}/search")
+    web.run_app(server.app(), host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
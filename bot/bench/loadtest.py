@@ -0,0 +1,277 @@
+"""Offline load test of the price sweep, !track and !search.
+
+Runs the real handlers from bot.py with three stand-ins. SerpApi is
+replaced by bench/fake_serpapi.py on a local port. Discord is replaced by
+the contexts and users in bench/fake_discord.py. Postgres is a scratch
+`loadtest` schema (public data is not touched), seeded with N alerts.
+For each size it reports throughput, p50/p99 latency, SerpApi calls and
+DB round trips. Every performance change can be measured the same way.
+
+Scenarios:
+    sweep   check_prices ticks until every seeded alert has been checked
+    track   concurrent !track commands from random users
+    search  concurrent 7-day !search commands
+
+Usage:
+    DATABASE_URL=postgresql://localhost/trackroth python bench/loadtest.py \
+        [--alerts 1000,10000,100000] [--routes 2000] [--latency-ms 150] [--error-rate 0.01] \
+        [--commands 200] [--concurrency 20] [--log loadtest.log] [--keep]
+
+The bot's own limits still apply, so tune them through the usual
+environment variables (SERPAPI_CONCURRENCY, DB_POOL_MAX, MAX_CHECKS_PER_TICK,
+...). The SerpApi quota and rate limit default to effectively unlimited
+here so they don't dominate the numbers.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import urlparse
+
+import psycopg2
+
+SCHEMA = "loadtest"
+
+# Must be set before the bot modules read their configuration
+os.environ["PGOPTIONS"] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={SCHEMA}".strip()
+for name, value in {
+    "SERPAPI_KEY": "loadtest",
+    "SERPAPI_MONTHLY_QUOTA": "100000000",
+    "SERPAPI_DAILY_QUOTA": "100000000",
+    "SERPAPI_RATE_PER_SECOND": "100000",
+    "SERPAPI_BURST": "100000",
+    "NOTIFY_MIN_INTERVAL_SECONDS": "0",
+    "MAX_CHECKS_PER_TICK": "1000",
+    "SEARCH_PROGRESS_SECONDS": "0.5",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot as botmod  # noqa: E402
+import db  # noqa: E402
+import flights  # noqa: E402
+from cache import QuoteCache  # noqa: E402
+from fake_discord import FakeBot, FakeContext, FakeUser  # noqa: E402
+from fake_serpapi import FakeSerpApi, start  # noqa: E402
+from scheduler import AlertScheduler  # noqa: E402
+
+ORIGINS = ["SEA", "PDX", "SFO", "LAX", "JFK", "ORD", "DFW", "BOS", "YVR", "DEN"]
+DESTINATIONS = ["NRT", "HND", "KIX", "ICN", "LHR", "CDG", "FRA", "AMS", "SYD", "HNL"]
+
+
+def connect():
+    db_url = urlparse(os.environ["DATABASE_URL"])
+    conn = psycopg2.connect(
+        host=db_url.hostname,
+        port=db_url.port,
+        user=db_url.username,
+        password=db_url.password,
+        database=db_url.path[1:],
+    )
+    conn.autocommit = True
+    return conn
+
+
+def seed(cursor, alerts, routes):
+    """(Re)create the loadtest schema with `alerts` alerts over `routes` distinct route/dates."""
+    users = max(alerts // 10, 1)
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in ("User", "Alert", "PriceHistory", "PriceHistoryDaily", "RouteQuote"):
+        cursor.execute(f'CREATE TABLE {SCHEMA}."{table}" (LIKE public."{table}" INCLUDING ALL)')
+
+    cursor.execute(f'''
+        INSERT INTO {SCHEMA}."User" (id, name, email, "discordId", "createdAt")
+        SELECT 'u' || i, 'discord:' || i, 'discord_' || i || '@trackroth.local', i::text, NOW()
+        FROM generate_series(1, %s) i
+    ''', (users,))
+    # Alert i watches route r = i mod routes: origin, destination and date are all derived from r
+    cursor.execute(f'''
+        INSERT INTO {SCHEMA}."Alert" (id, "userId", origin, destination, "departureDate", "maxPrice", "lastPrice",
+                                      "isActive", "createdAt", "updatedAt")
+        SELECT 'a' || lpad(i::text, 9, '0'), 'u' || (1 + i %% %s),
+               (%s::text[])[1 + (i %% %s) %% 10],
+               (%s::text[])[1 + ((i %% %s) / 10) %% 10],
+               CURRENT_DATE + 1 + (i %% %s) / 100,
+               CASE WHEN random() < 0.5 THEN 450 + random() * 400 END,
+               500 + random() * 600,
+               true, NOW(), NOW()
+        FROM generate_series(1, %s) i
+    ''', (users, ORIGINS, routes, DESTINATIONS, routes, routes, alerts))
+    for table in ("User", "Alert"):
+        cursor.execute(f'ANALYZE {SCHEMA}."{table}"')
+    return users
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Run:
+    """Counters for one scenario, taken as deltas around it."""
+
+    def __init__(self, name, serpapi, fake_bot):
+        self.name = name
+        self.serpapi = serpapi
+        self.fake_bot = fake_bot
+        self.latencies = []
+        self.ops = 0
+
+    def __enter__(self):
+        self.serpapi.reset()
+        self.db_before = db.pool_stats()
+        self.dms_before = self.fake_bot.dms()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.db_after = db.pool_stats()
+        self.api = self.serpapi.stats()
+        self.cache = flights.client.cache.stats()
+
+    async def timed(self, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.latencies.append((time.perf_counter() - start) * 1000)
+
+    def report(self, unit):
+        queries = self.db_after["queries"] - self.db_before["queries"]
+        commits = self.db_after["commits"] - self.db_before["commits"]
+        print(
+            f"  {self.name:7} {self.ops:>8,} {unit:8} {self.elapsed:8.1f}s {self.ops / self.elapsed:9.1f}/s"
+            f"   p50 {percentile(self.latencies, 50):8.1f} ms   p99 {percentile(self.latencies, 99):8.1f} ms"
+            f"   api {self.api['calls']:>7,} ({self.api['errors']} err, {self.api['max_in_flight']} max in flight)"
+            f"   db {queries:>7,} queries / {commits:,} commits"
+            f"   cache hit {self.cache['hit_rate']:.0%}"
+            f"   dms {self.fake_bot.dms() - self.dms_before:,}",
+            flush=True
+        )
+
+
+def reset_bot_state(cursor):
+    """Start each scenario cold: empty quote cache, route ledger and scheduler."""
+    flights.client.cache = QuoteCache(flights.QUOTE_CACHE_TTL_SECONDS, flights.QUOTE_CACHE_SIZE)
+    cursor.execute(f'TRUNCATE {SCHEMA}."RouteQuote"')
+    botmod.scheduler = AlertScheduler()
+
+
+async def run_sweep(run):
+    """Drive check_prices until every alert has had its first check."""
+    scheduler = botmod.scheduler
+    botmod.notifier.start()
+
+    # First tick loads the alerts; then make all of them due at once
+    await run.timed(botmod.check_prices())
+    scheduler.requeue(scheduler.pop_due(float("inf")), 0, now=1)
+
+    while (scheduler.next_due() or float("inf")) <= time.time():
+        await run.timed(botmod.check_prices())
+    run.ops = len(scheduler)
+
+    await botmod.notifier.stop(timeout=60)
+
+
+async def run_commands(run, make_call, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await run.timed(make_call(i))
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    run.ops = count
+
+
+def track_call(rnd, users):
+    def make(i):
+        user = FakeUser(rnd.randint(1, users))
+        origin = rnd.choice(ORIGINS) if rnd.random() < 0.7 else ",".join(rnd.sample(ORIGINS, 2))
+        departure = date.today() + timedelta(days=rnd.randint(1, 120))
+        return botmod.track_flight(FakeContext(user), origin, rnd.choice(DESTINATIONS), departure.isoformat(),
+                                   float(rnd.randint(400, 900)))
+    return make
+
+
+def search_call(rnd, users):
+    def make(i):
+        user = FakeUser(rnd.randint(1, users))
+        start = date.today() + timedelta(days=rnd.randint(1, 110))
+        return botmod.search_flights(FakeContext(user), rnd.choice(ORIGINS), rnd.choice(DESTINATIONS),
+                                     start.isoformat(), (start + timedelta(days=6)).isoformat())
+    return make
+
+
+async def run_size(cursor, serpapi, fake_bot, args, alerts, log):
+    routes = min(args.routes, alerts)
+    users = seed(cursor, alerts, routes)
+    print(f"\n== {alerts:,} alerts, {routes:,} distinct routes, {users:,} users ==", flush=True)
+    rnd = random.Random(alerts)
+
+    reset_bot_state(cursor)
+    with Run("sweep", serpapi, fake_bot) as run, contextlib.redirect_stdout(log):
+        await run_sweep(run)
+    run.report("alerts")
+
+    reset_bot_state(cursor)
+    with Run("track", serpapi, fake_bot) as run, contextlib.redirect_stdout(log):
+        await run_commands(run, track_call(rnd, users), args.commands, args.concurrency)
+    run.report("commands")
+
+    reset_bot_state(cursor)
+    with Run("search", serpapi, fake_bot) as run, contextlib.redirect_stdout(log):
+        await run_commands(run, search_call(rnd, users), max(args.commands // 4, 1), args.concurrency)
+    run.report("commands")
+
+
+async def main_async(args):
+    serpapi = FakeSerpApi(args.latency_ms, args.error_rate)
+    runner, base_url = await start(serpapi)
+    flights.client.url = f"{base_url}/search"
+
+    fake_bot = FakeBot()
+    botmod.notifier.bot = fake_bot
+
+    conn = connect()
+    cursor = conn.cursor()
+    print(f"Fake SerpApi at {base_url} ({args.latency_ms:.0f} ms median, {args.error_rate:.1%} errors); "
+          f"SerpApi concurrency {flights.SERPAPI_CONCURRENCY}, DB pool {db.DB_POOL_MAX}", flush=True)
+    try:
+        with open(args.log, "w") as log:
+            for alerts in args.alerts:
+                await run_size(cursor, serpapi, fake_bot, args, alerts, log)
+    finally:
+        await flights.client.close()
+        await runner.cleanup()
+        db.close()
+        if not args.keep:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alerts", type=lambda s: [int(n) for n in s.split(",")], default=[1_000, 10_000, 100_000])
+    parser.add_argument("--routes", type=int, default=2000, help="distinct route/date combinations")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--commands", type=int, default=200, help="!track commands per size (a quarter as many !search)")
+    parser.add_argument("--concurrency", type=int, default=20, help="commands in flight at once")
+    parser.add_argument("--log", default=os.devnull, help="where the bot's own output goes")
+    parser.add_argument("--keep", action="store_true", help="keep the loadtest schema afterwards")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Check multi-airport lookups against single-pair lookups on the fake SerpApi server.
+
+For random origin × destination sets it calls FlightClient.get_flight_prices
+(one comma-list request per date, plus fallbacks for pairs the response
+omits). It also calls get_flight_price once per pair on a cold client.
+Every pair must get a quote for its own airports, at the same price as the
+single-pair lookup. The report also shows the API calls each way used.
+
+Usage:
+    python bench/validate_grouped.py [--cases 200] [--coverage 0.8] [--replay DIR]
+
+Prices only match when the server is deterministic. The generated
+responses are (no jitter). So are replayed ones, provided DIR holds the
+single-pair responses as well as the grouped ones.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_serpapi import FakeSerpApi, start  # noqa: E402
+from flights import FlightClient  # noqa: E402
+from quota import QuotaBudget, RateLimiter, TokenBucket  # noqa: E402
+
+AIRPORTS = {
+    "origins": ["SEA", "PDX", "SFO", "LAX", "YVR"],
+    "destinations": ["NRT", "HND", "KIX", "ICN"],
+}
+
+
+def new_client(url):
+    limiter = RateLimiter(TokenBucket(10_000, 10_000), QuotaBudget(10**9, 10**9, 0))
+    return FlightClient("validate", url=url, limiter=limiter)
+
+
+async def validate(args):
+    server = FakeSerpApi(latency_ms=0, jitter=0, coverage=args.coverage, replay_dir=args.replay)
+    runner, base_url = await start(server)
+    rnd = random.Random(7)
+    checked = mismatches = missing = 0
+    grouped_calls = single_calls = 0
+
+    # The client logs every lookup; keep the report readable
+    try:
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            for _ in range(args.cases):
+                origins = rnd.sample(AIRPORTS["origins"], rnd.randint(1, 2))
+                destinations = rnd.sample(AIRPORTS["destinations"], rnd.randint(1, 3))
+                day = (date.today() + timedelta(days=rnd.randint(1, 200))).isoformat()
+
+                grouped_client, single_client = new_client(f"{base_url}/search"), new_client(f"{base_url}/search")
+                try:
+                    server.reset()
+                    quotes = await grouped_client.get_flight_prices(origins, destinations, day)
+                    grouped_calls += server.calls
+
+                    server.reset()
+                    for (origin, destination), quote in quotes.items():
+                        expected = await single_client.get_flight_price(origin, destination, day)
+                        checked += 1
+                        if quote is None or expected is None:
+                            if (quote is None) != (expected is None):
+                                missing += 1
+                            continue
+                        if (quote.origin, quote.destination, quote.price) != (origin, destination, expected.price):
+                            mismatches += 1
+                            print(f"MISMATCH {origin}->{destination} {day}: grouped {quote.origin}->{quote.destination} "
+                                  f"${quote.price}, single ${expected.price}", file=sys.stderr)
+                    single_calls += server.calls
+                finally:
+                    await grouped_client.close()
+                    await single_client.close()
+    finally:
+        await runner.cleanup()
+
+    print(f"{args.cases} cases, {checked} pairs checked: {mismatches} mismatched, {missing} missing on one side")
+    print(f"API calls: {grouped_calls} grouped (incl. fallbacks) vs {single_calls} single-pair "
+          f"({single_calls / max(grouped_calls, 1):.1f}x fewer)")
+    return mismatches == 0 and missing == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=200)
+    parser.add_argument("--coverage", type=float, default=0.8, help="share of pairs grouped responses include")
+    parser.add_argument("--replay", metavar="DIR", help="serve saved responses from DIR when present")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(validate(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
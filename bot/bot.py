@@ -1,224 +1,81 @@
 import discord
 from discord.ext import commands, tasks
 import os
-import requests
-from datetime import datetime, timedelta
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from urllib.parse import urlparse
+import asyncio
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+
+import db
+import flights
+import metrics
+from notify import NotificationDispatcher
+from db import (
+    get_or_create_user, add_alert, add_alerts, get_user_alerts, get_user_alerts_page, find_user_alerts,
+    iter_active_alerts, get_active_alerts_by_ids, claim_due_alerts, release_alerts, save_checkpoints,
+    remove_alert, deactivate_expired_alerts, record_serpapi_usage, bulk_update_last_prices, PriceWriter
+)
+from flights import (
+    get_flight_price, get_flight_prices, INTERACTIVE_MAX_AGE_SECONDS as INTERACTIVE_MAX_AGE,
+    SERPAPI_GROUPED_QUERIES
+)
+from bulk_import import IMPORT_MAX_BYTES, InvalidImport, parse_import
+from circuit import CLOSED, ProviderUnavailable
+from fairshare import FairScheduler, QueueFull
+from ledger import ROUTE_LEDGER, RouteLedger, prune_route_quotes
+from quota import BACKGROUND, QuotaExceeded
+from retention import get_daily_prices, maintain_price_history
+from scheduler import AlertScheduler, CHECK_MIN_MINUTES, SWEEP_WARMUP_MINUTES, next_check_delay
+from trends import TrendCache, DEFAULT_DROP, TREND_MIN_SAMPLES, TREND_ROLLING_DAYS, TREND_WINDOW_DAYS, sparkline
 
 # Configuration
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
-CHECK_INTERVAL_MINUTES = int(os.getenv("CHECK_INTERVAL_MINUTES", 360))
-
-# Parse database URL
-db_url = urlparse(DATABASE_URL)
-
-def get_db():
-    return psycopg2.connect(
-        host=db_url.hostname,
-        port=db_url.port,
-        user=db_url.username,
-        password=db_url.password,
-        database=db_url.path[1:],
-        cursor_factory=RealDictCursor
-    )
+# all: commands + in-process sweep | commands: commands only | worker: sweep only, sharded via leases
+BOT_ROLE = os.getenv("BOT_ROLE", "all")
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+WORKER_LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", 300))
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", 60))
+ALERT_REFRESH_MINUTES = int(os.getenv("ALERT_REFRESH_MINUTES", 10))
+MAX_CHECKS_PER_TICK = int(os.getenv("MAX_CHECKS_PER_TICK", 100))
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", 24))
+# How often each process adds its SerpApi calls to the shared "SerpApiUsage" counter
+QUOTA_SHARE_SECONDS = float(os.getenv("QUOTA_SHARE_SECONDS", 10))
+MAX_SEARCH_CALLS = int(os.getenv("MAX_SEARCH_CALLS", 90))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", 60))
+SEARCH_PROGRESS_SECONDS = float(os.getenv("SEARCH_PROGRESS_SECONDS", 2))
+# Routes !import prices right away; the sweep picks up the rest
+IMPORT_PRICE_ROUTES = int(os.getenv("IMPORT_PRICE_ROUTES", 90))
+# Alerts per !list page (Discord allows 25 embed fields), and how long its buttons work
+LIST_PAGE_SIZE = min(int(os.getenv("LIST_PAGE_SIZE", 10)), 25)
+LIST_TIMEOUT_SECONDS = float(os.getenv("LIST_TIMEOUT_SECONDS", 300))
+BOT_ADMIN_IDS = {int(i) for i in os.getenv("BOT_ADMIN_IDS", "").split(",") if i.strip()}
 
 # Initialize Discord bot
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
 
-def get_or_create_user(discord_id, discord_name):
-    """Get or create a user by Discord ID."""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if user exists with this discord ID in name field (we'll use name to store discord_id)
-    cursor.execute(
-        'SELECT * FROM "User" WHERE name = %s',
-        (f"discord:{discord_id}",)
-    )
-    user = cursor.fetchone()
-    
-    if not user:
-        # Create new user
-        import uuid
-        user_id = str(uuid.uuid4())[:25]  # cuid-like
-        cursor.execute(
-            'INSERT INTO "User" (id, name, email) VALUES (%s, %s, %s) RETURNING *',
-            (user_id, f"discord:{discord_id}", f"discord_{discord_id}@trackroth.local")
-        )
-        user = cursor.fetchone()
-        conn.commit()
-    
-    conn.close()
-    return user
-
-def add_alert(user_id, origin, destination, departure_date, max_price=None):
-    """Add a new flight alert."""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    import uuid
-    alert_id = str(uuid.uuid4())[:25]
-    
-    cursor.execute('''
-        INSERT INTO "Alert" (id, "userId", origin, destination, "departureDate", "maxPrice", "isActive", "createdAt", "updatedAt")
-        VALUES (%s, %s, %s, %s, %s, %s, true, NOW(), NOW())
-        RETURNING *
-    ''', (alert_id, user_id, origin.upper(), destination.upper(), departure_date, max_price))
-    
-    alert = cursor.fetchone()
-    conn.commit()
-    conn.close()
-    return alert
-
-def get_user_alerts(user_id):
-    """Get all active alerts for a user."""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM "Alert" 
-        WHERE "userId" = %s AND "isActive" = true
-        ORDER BY "createdAt" DESC
-    ''', (user_id,))
-    
-    alerts = cursor.fetchall()
-    conn.close()
-    return alerts
-
-def get_all_active_alerts():
-    """Get all active alerts with user info."""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT a.*, u.name, u.email 
-        FROM "Alert" a
-        JOIN "User" u ON a."userId" = u.id
-        WHERE a."isActive" = true AND a."departureDate" >= CURRENT_DATE
-    ''')
-    
-    alerts = cursor.fetchall()
-    conn.close()
-    return alerts
-
-def remove_alert(alert_id, user_id):
-    """Deactivate an alert."""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE "Alert" SET "isActive" = false, "updatedAt" = NOW()
-        WHERE id = %s AND "userId" = %s
-    ''', (alert_id, user_id))
-    
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return deleted
-
-def update_last_price(alert_id, price):
-    """Update the last known price for an alert."""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE "Alert" SET "lastPrice" = %s, "updatedAt" = NOW()
-        WHERE id = %s
-    ''', (price, alert_id))
-    
-    # Also save to price history
-    import uuid
-    history_id = str(uuid.uuid4())[:25]
-    cursor.execute('''
-        INSERT INTO "PriceHistory" (id, "alertId", price, "checkedAt")
-        VALUES (%s, %s, %s, NOW())
-    ''', (history_id, alert_id, price))
-    
-    conn.commit()
-    conn.close()
-
-def get_flight_price(origin, destination, departure_date):
-    """Fetch the cheapest flight details from Google Flights via SerpApi."""
-    try:
-        print(f"Searching flights: {origin} -> {destination} on {departure_date}", flush=True)
-        
-        params = {
-            "engine": "google_flights",
-            "departure_id": origin.upper(),
-            "arrival_id": destination.upper(),
-            "outbound_date": departure_date,
-            "currency": "USD",
-            "hl": "en",
-            "type": "2",
-            "api_key": SERPAPI_KEY
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
-        
-        if "error" in data:
-            print(f"SerpApi error: {data['error']}", flush=True)
-            return None
-        
-        flights = data.get("best_flights", []) or data.get("other_flights", [])
-        
-        if flights and len(flights) > 0:
-            flight = flights[0]
-            price = flight.get("price")
-            
-            if price:
-                # Get flight leg details
-                legs = flight.get("flights", [])
-                airline = "Unknown"
-                departure_time = ""
-                arrival_time = ""
-                duration = ""
-                stops = len(legs) - 1 if legs else 0
-                
-                if legs:
-                    first_leg = legs[0]
-                    airline = first_leg.get("airline", "Unknown")
-                    departure_time = first_leg.get("departure_airport", {}).get("time", "")
-                    
-                    last_leg = legs[-1]
-                    arrival_time = last_leg.get("arrival_airport", {}).get("time", "")
-                
-                # Get total duration
-                duration = flight.get("total_duration", 0)
-                hours = duration // 60
-                mins = duration % 60
-                duration_str = f"{hours}h {mins}m" if duration else ""
-                
-                # Build Google Flights link (one-way)
-                # Format: /flights/origin/destination/date
-                booking_link = f"https://www.google.com/travel/flights/search?tfs=CBwQAhojEgoyMDI2LTAxLTIwagcIARIDSkZLcgcIARIDTEFYGgA&tfu=EgYIARABGAA&hl=en&gl=us&curr=USD"
-                # Simpler fallback link that usually works
-                booking_link = f"https://www.google.com/travel/flights?q=one%20way%20flights%20from%20{origin}%20to%20{destination}%20on%20{departure_date}&curr=USD"
-                
-                print(f"Found: ${price} on {airline} at {departure_time}", flush=True)
-                
-                return {
-                    "price": float(price),
-                    "airline": airline,
-                    "departure_time": departure_time,
-                    "arrival_time": arrival_time,
-                    "duration": duration_str,
-                    "stops": stops,
-                    "link": booking_link
-                }
-        
-        print("No flight data returned", flush=True)
-        return None
-        
-    except Exception as e:
-        print(f"Unexpected error: {type(e).__name__}: {e}", flush=True)
-        return None
+class TrackRothBot(commands.Bot):
+    async def close(self):
+        # Deliver queued DMs, then release pooled SerpApi and database connections
+        await notifier.stop()
+        await metrics.stop()
+        await flights.client.close()
+        await super().close()
+        db.close()
+
+bot = TrackRothBot(command_prefix="!", intents=intents)
+notifier = NotificationDispatcher(bot)
+trend_cache = TrendCache()
+fair = FairScheduler()
+
+# Commands queue per user and their SerpApi lookups take turns between users
+flights.client.fair = fair
+
+# Share quotes with the web cron and other bot processes through "RouteQuote"
+if ROUTE_LEDGER:
+    flights.client.ledger = RouteLedger(WORKER_ID)
 
 # Store channel IDs for Discord notifications
 discord_channels = {}
@@ -228,8 +85,58 @@ async def on_ready():
     print(f"Bot is online as {bot.user}", flush=True)
     print(f"SerpApi Key loaded: {'Yes' if SERPAPI_KEY else 'NO - MISSING!'}", flush=True)
     print(f"Database connected: {'Yes' if DATABASE_URL else 'NO - MISSING!'}", flush=True)
-    if not check_prices.is_running():
+    await flights.client.sync_quota()
+    await metrics.start()
+    notifier.start()
+    if not share_quota_usage.is_running():
+        share_quota_usage.start()
+    if BOT_ROLE == "all" and not check_prices.is_running():
         check_prices.start()
+    if not price_history_maintenance.is_running():
+        price_history_maintenance.start()
+
+@bot.before_invoke
+async def start_command(ctx):
+    ctx.started_at = time.perf_counter()
+    try:
+        await fair.enter(ctx.author.id, ctx.command.name)
+    except QueueFull:
+        raise commands.MaxConcurrencyReached(fair.max_concurrent + fair.max_queued, commands.BucketType.user)
+
+@bot.after_invoke
+async def finish_command(ctx):
+    fair.leave(ctx.author.id, ctx.command.name)
+    metrics.observe("command_seconds", time.perf_counter() - ctx.started_at, command=ctx.command.name)
+
+@bot.event
+async def on_command_error(ctx, error):
+    original = getattr(error, "original", error)
+    if ctx.command is not None:
+        metrics.inc("command_errors_total", command=ctx.command.name, cause=type(original).__name__)
+    if isinstance(original, QuotaExceeded):
+        await ctx.send("❌ Flight lookups are paused: the API quota for today/this month is used up.")
+        return
+    if isinstance(original, ProviderUnavailable):
+        retry_in = flights.client.breaker.retry_in()
+        await ctx.send(f"❌ The flight data provider is having trouble. Please try again in {max(retry_in, 5):.0f} seconds.")
+        return
+    if isinstance(error, commands.CheckFailure):
+        await ctx.send("❌ You don't have permission to use this command.")
+        return
+    if isinstance(error, commands.MaxConcurrencyReached):
+        await ctx.send("⏳ You already have several commands running. Please wait for them to finish.")
+        return
+    if isinstance(error, commands.CommandNotFound):
+        return
+    raise error
+
+def is_bot_admin():
+    """Allow bot admins (BOT_ADMIN_IDS) and server administrators."""
+    async def predicate(ctx):
+        if ctx.author.id in BOT_ADMIN_IDS:
+            return True
+        return ctx.guild is not None and ctx.author.guild_permissions.administrator
+    return commands.check(predicate)
 
 @bot.command(name="track")
 async def track_flight(ctx, origin: str, destination: str, departure_date: str, max_price: float = None):
@@ -260,7 +167,7 @@ async def track_flight(ctx, origin: str, destination: str, departure_date: str,
             return
     
     # Get or create user
-    user = get_or_create_user(ctx.author.id, str(ctx.author))
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
     
     # Store channel for notifications
     discord_channels[user['id']] = ctx.channel.id
@@ -274,18 +181,15 @@ async def track_flight(ctx, origin: str, destination: str, departure_date: str,
     
     await ctx.send(f"🔍 Searching {len(all_routes)} route(s)...")
     
-    results = []
-    for orig, dest in all_routes:
-        flight_data = get_flight_price(orig, dest, departure_date)
-        if flight_data:
-            flight_data['origin'] = orig
-            flight_data['destination'] = dest
-            results.append(flight_data)
+    # One multi-airport lookup covers every route
+    lookups = await get_flight_prices(origins, destinations, departure_date, max_age=INTERACTIVE_MAX_AGE)
+    
+    results = [flight_data for flight_data in lookups.values() if flight_data]
     
     if not results:
         # Still create alerts for tracking
         for orig, dest in all_routes:
-            add_alert(user['id'], orig, dest, departure_date, max_price)
+            await add_alert(user['id'], orig, dest, departure_date, max_price)
         await ctx.send(
             f"✅ Now tracking **{len(all_routes)} route(s)** for **{departure_date}**\n"
             f"Could not fetch prices right now (will retry later)"
@@ -293,40 +197,46 @@ async def track_flight(ctx, origin: str, destination: str, departure_date: str,
         return
     
     # Find cheapest
-    cheapest = min(results, key=lambda x: x['price'])
+    cheapest = min(results, key=lambda x: x.price)
     
     # Create alerts for all routes
+    prices = []
     for orig, dest in all_routes:
-        alert = add_alert(user['id'], orig, dest, departure_date, max_price)
+        alert = await add_alert(user['id'], orig, dest, departure_date, max_price)
         # Update price if we have it
-        matching = [r for r in results if r['origin'] == orig and r['destination'] == dest]
-        if matching:
-            update_last_price(alert['id'], matching[0]['price'])
+        flight_data = lookups.get((orig, dest))
+        if flight_data:
+            prices.append((alert['id'], flight_data.price))
+    await bulk_update_last_prices(prices)
     
-    stops_text = "Nonstop" if cheapest['stops'] == 0 else f"{cheapest['stops']} stop(s)"
+    stops_text = cheapest.stops_text
     
     embed = discord.Embed(
         title=f"✅ Tracking {len(all_routes)} Route(s)",
-        description=f"🏆 **Cheapest: {cheapest['origin']} → {cheapest['destination']}**",
+        description=f"🏆 **Cheapest: {cheapest.origin} → {cheapest.destination}**",
         color=0x00ff00
     )
-    embed.add_field(name="💰 One-Way Price", value=f"**${cheapest['price']:.2f}**", inline=True)
-    embed.add_field(name="✈️ Airline", value=cheapest['airline'], inline=True)
-    embed.add_field(name="🕐 Departure", value=cheapest['departure_time'] or "N/A", inline=True)
-    embed.add_field(name="🕐 Arrival", value=cheapest['arrival_time'] or "N/A", inline=True)
-    embed.add_field(name="⏱️ Duration", value=cheapest['duration'] or "N/A", inline=True)
+    embed.add_field(name="💰 One-Way Price", value=f"**${cheapest.price:.2f}**", inline=True)
+    embed.add_field(name="✈️ Airline", value=cheapest.airline, inline=True)
+    embed.add_field(name="🕐 Departure", value=cheapest.departure_time or "N/A", inline=True)
+    embed.add_field(name="🕐 Arrival", value=cheapest.arrival_time or "N/A", inline=True)
+    embed.add_field(name="⏱️ Duration", value=cheapest.duration or "N/A", inline=True)
     embed.add_field(name="🛑 Stops", value=stops_text, inline=True)
     
     if max_price:
         embed.add_field(name="🎯 Target Price", value=f"${max_price:.2f}", inline=True)
     
+    if cheapest.alternatives:
+        options = "\n".join([f"• ${q.price:.2f} · {q.airline} · {q.stops_text}" for q in cheapest.alternatives])
+        embed.add_field(name="🔀 Other Options", value=options, inline=False)
+    
     # Show all routes with prices
     if len(results) > 1:
-        sorted_results = sorted(results, key=lambda x: x['price'])
-        price_list = "\n".join([f"• {r['origin']}→{r['destination']}: ${r['price']:.2f}" for r in sorted_results])
+        sorted_results = sorted(results, key=lambda x: x.price)
+        price_list = "\n".join([f"• {r.origin}→{r.destination}: ${r.price:.2f}" for r in sorted_results])
         embed.add_field(name="📊 All Routes", value=price_list, inline=False)
     
-    embed.add_field(name="🔗 Book Now", value=f"[Google Flights]({cheapest['link']})", inline=False)
+    embed.add_field(name="🔗 Book Now", value=f"[Google Flights]({cheapest.link})", inline=False)
     embed.set_footer(text=f"Date: {departure_date} | Tracking {len(all_routes)} route(s)")
     
     await ctx.send(embed=embed)
@@ -368,103 +278,292 @@ async def search_flights(ctx, origin: str, destination: str, start_date: str, en
             return
     
     all_routes = [(o, d) for o in origins for d in destinations]
-    total_api_calls = (days_diff + 1) * len(all_routes)
+    # Each day is one multi-airport request; routes it misses are skipped rather than
+    # looked up one by one, so this is also the most a search can send
+    grouped = SERPAPI_GROUPED_QUERIES and len(all_routes) > 1
+    total_api_calls = (days_diff + 1) * (1 if grouped else len(all_routes))
     
     # Limit total API calls
-    if total_api_calls > 30:
-        await ctx.send(f"❌ Too many API calls ({total_api_calls})! Reduce date range or airports. Max 30 calls.")
+    if total_api_calls > MAX_SEARCH_CALLS:
+        await ctx.send(f"❌ Too many API calls ({total_api_calls})! Reduce date range or airports. Max {MAX_SEARCH_CALLS} calls.")
         return
     
-    await ctx.send(f"🔍 Searching {len(all_routes)} route(s) × {days_diff + 1} days = **{total_api_calls} searches**...")
+    header = f"🔍 Searching {len(all_routes)} route(s) × {days_diff + 1} days = **{total_api_calls} searches**..."
+    status = await ctx.send(header)
     
-    # Search all combinations
+    dates = []
+    current = start
+    while current <= end:
+        dates.append(current.strftime("%Y-%m-%d"))
+        current = current + timedelta(days=1)
+    
+    # Look up every day concurrently (all routes per day) and report progress as days complete
+    tasks = [
+        asyncio.create_task(get_flight_prices(origins, destinations, date_str, max_age=INTERACTIVE_MAX_AGE, fallback=False))
+        for date_str in dates
+    ]
     all_results = []
+    done = 0
+    timed_out = False
+    last_update = asyncio.get_running_loop().time()
     
-    for orig, dest in all_routes:
-        current = start
-        while current <= end:
-            date_str = current.strftime("%Y-%m-%d")
-            flight_data = get_flight_price(orig, dest, date_str)
-            
-            if flight_data:
-                flight_data['date'] = date_str
-                flight_data['origin'] = orig
-                flight_data['destination'] = dest
-                all_results.append(flight_data)
+    try:
+        for lookup in asyncio.as_completed(tasks, timeout=SEARCH_TIMEOUT_SECONDS):
+            lookups = await lookup
+            done += 1
+            all_results.extend(flight_data for flight_data in lookups.values() if flight_data)
             
-            current = current + timedelta(days=1)
+            # Throttle edits to stay clear of Discord's rate limits
+            now = asyncio.get_running_loop().time()
+            if done < len(tasks) and now - last_update >= SEARCH_PROGRESS_SECONDS:
+                last_update = now
+                progress = f"{header}\n⏳ {done}/{len(tasks)} days done"
+                if all_results:
+                    best = min(all_results, key=lambda x: x.price)
+                    progress += f" | Cheapest so far: {best.origin}→{best.destination} {best.date} **${best.price:.2f}**"
+                await status.edit(content=progress)
+    except asyncio.TimeoutError:
+        timed_out = True
+    except asyncio.CancelledError:
+        # A newer !search from the same user replaced this one
+        await status.edit(content=f"{header}\n⏹️ Stopped after {done}/{len(tasks)} days: replaced by your newer search")
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    if timed_out:
+        await status.edit(content=f"{header}\n⚠️ Timed out after {done}/{len(tasks)} days, showing partial results")
+    else:
+        await status.edit(content=f"{header}\n✅ {done}/{len(tasks)} days done")
     
     if not all_results:
         await ctx.send(f"❌ No flights found for any route in that date range.")
         return
     
     # Find cheapest overall
-    cheapest = min(all_results, key=lambda x: x['price'])
+    cheapest = min(all_results, key=lambda x: x.price)
     
-    stops_text = "Nonstop" if cheapest['stops'] == 0 else f"{cheapest['stops']} stop(s)"
+    stops_text = cheapest.stops_text
     
     embed = discord.Embed(
-        title=f"🏆 Cheapest: {cheapest['origin']} → {cheapest['destination']}",
+        title=f"🏆 Cheapest: {cheapest.origin} → {cheapest.destination}",
         description=f"Best price from {start_date} to {end_date}",
         color=0xffd700
     )
-    embed.add_field(name="📅 Best Date", value=f"**{cheapest['date']}**", inline=True)
-    embed.add_field(name="💰 One-Way Price", value=f"**${cheapest['price']:.2f}**", inline=True)
-    embed.add_field(name="✈️ Airline", value=cheapest['airline'], inline=True)
-    embed.add_field(name="🕐 Departure", value=cheapest['departure_time'] or "N/A", inline=True)
-    embed.add_field(name="⏱️ Duration", value=cheapest['duration'] or "N/A", inline=True)
+    embed.add_field(name="📅 Best Date", value=f"**{cheapest.date}**", inline=True)
+    embed.add_field(name="💰 One-Way Price", value=f"**${cheapest.price:.2f}**", inline=True)
+    embed.add_field(name="✈️ Airline", value=cheapest.airline, inline=True)
+    embed.add_field(name="🕐 Departure", value=cheapest.departure_time or "N/A", inline=True)
+    embed.add_field(name="⏱️ Duration", value=cheapest.duration or "N/A", inline=True)
     embed.add_field(name="🛑 Stops", value=stops_text, inline=True)
-    embed.add_field(name="🔗 Book Now", value=f"[Google Flights]({cheapest['link']})", inline=False)
+    embed.add_field(name="🔗 Book Now", value=f"[Google Flights]({cheapest.link})", inline=False)
     
     # Show top 5 cheapest options
     if len(all_results) > 1:
-        sorted_results = sorted(all_results, key=lambda x: x['price'])[:5]
-        price_list = "\n".join([f"• {r['origin']}→{r['destination']} {r['date']}: ${r['price']:.2f}" for r in sorted_results])
+        sorted_results = sorted(all_results, key=lambda x: x.price)[:5]
+        price_list = "\n".join([f"• {r.origin}→{r.destination} {r.date}: ${r.price:.2f}" for r in sorted_results])
         embed.add_field(name="📊 Top 5 Cheapest", value=price_list, inline=False)
     
-    embed.set_footer(text=f"Searched {len(all_results)} flights | Use !track to monitor a specific route")
+    partial = f" (partial: {done}/{len(tasks)} days)" if timed_out else ""
+    embed.set_footer(text=f"Searched {len(all_results)} flights{partial} | Use !track to monitor a specific route")
     
     await ctx.send(embed=embed)
 
-@bot.command(name="list")
-async def list_alerts(ctx):
-    """List your flight alerts."""
-    user = get_or_create_user(ctx.author.id, str(ctx.author))
-    alerts = get_user_alerts(user['id'])
+async def price_new_alerts(alerts):
+    """Fetch first prices for newly imported alerts.
     
-    if not alerts:
-        await ctx.send("No active alerts. Use `!track` to add one!")
+    Alerts on the same route share one lookup. Up to IMPORT_PRICE_ROUTES
+    routes (soonest departures first) are fetched concurrently at
+    background priority, so an import can't spend the budget kept for
+    commands. Routes not priced within SEARCH_TIMEOUT_SECONDS are left to
+    the sweep. Returns ({route key: FlightQuote}, routes attempted).
+    """
+    groups = group_alerts_by_route(alerts)
+    keys = sorted(groups, key=lambda key: key[2])[:IMPORT_PRICE_ROUTES]
+    
+    async def lookup(key):
+        try:
+            return key, await get_flight_price(*key, priority=BACKGROUND)
+        except (QuotaExceeded, ProviderUnavailable):
+            return key, None
+    
+    tasks = [asyncio.ensure_future(lookup(key)) for key in keys]
+    if not tasks:
+        return {}, 0
+    done, pending = await asyncio.wait(tasks, timeout=SEARCH_TIMEOUT_SECONDS)
+    for task in pending:
+        task.cancel()
+    
+    quotes = {key: quote for key, quote in (task.result() for task in done) if quote}
+    writer = PriceWriter()
+    for key, quote in quotes.items():
+        for alert in groups[key]:
+            await writer.add(alert['id'], quote.price)
+    await writer.flush()
+    return quotes, len(keys)
+
+@bot.command(name="import")
+async def import_alerts(ctx):
+    """
+    Track many routes at once from an attached CSV or JSON file.
+    Columns: origin,destination,date[,max_price]
+    """
+    if not ctx.message.attachments:
+        await ctx.send(
+            "❌ Attach a CSV (`origin,destination,date,max_price`) or JSON file "
+            "(`[{\"origin\": \"SEA\", \"destination\": \"NRT\", \"date\": \"2026-06-15\"}]`) to `!import`"
+        )
         return
     
-    embed = discord.Embed(title="✈️ Your Flight Alerts", color=0x00aaff)
+    attachment = ctx.message.attachments[0]
+    if attachment.size > IMPORT_MAX_BYTES:
+        await ctx.send(f"❌ File is larger than {IMPORT_MAX_BYTES // 1000} KB")
+        return
     
-    for alert in alerts:
-        date_str = alert['departureDate'].strftime("%Y-%m-%d")
-        price_info = f"${alert['lastPrice']:.2f}" if alert['lastPrice'] else "Checking..."
-        target = f" | Target: ${alert['maxPrice']:.2f}" if alert['maxPrice'] else ""
-        
+    try:
+        rows, errors, duplicates = parse_import(await attachment.read(), attachment.filename)
+    except InvalidImport as e:
+        await ctx.send(f"❌ {e}")
+        return
+    
+    # All or nothing: a half-imported file is harder to fix than a rejected one
+    if errors:
+        problems = "\n".join(errors[:10])
+        if len(errors) > 10:
+            problems += f"\n...and {len(errors) - 10} more"
+        embed = discord.Embed(title="❌ Import Rejected", description="Nothing was imported. Fix these and upload again.", color=0xff0000)
+        embed.add_field(name=f"{len(errors)} Problem(s)", value=problems[:1024], inline=False)
+        await ctx.send(embed=embed)
+        return
+    
+    start = time.perf_counter()
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
+    discord_channels[user['id']] = ctx.channel.id
+    
+    async with ctx.typing():
+        # One batched insert for the whole file
+        alerts = await add_alerts(user['id'], rows)
+        quotes, attempted = await price_new_alerts(alerts)
+    
+    routes = len(group_alerts_by_route(alerts))
+    embed = discord.Embed(title=f"📥 Imported {len(alerts)} Alert(s)", color=0x00ff00)
+    embed.add_field(name="📄 In File", value=f"{len(rows)} route(s)" + (f" (+{duplicates} repeats)" if duplicates else ""), inline=True)
+    embed.add_field(name="♻️ Already Tracked", value=str(len(rows) - len(alerts)), inline=True)
+    embed.add_field(name="💰 Priced Now", value=f"{len(quotes)}/{routes} route(s)", inline=True)
+    if routes > len(quotes):
+        embed.add_field(name="⏳ Queued", value=f"{routes - len(quotes)} route(s) get their first price from the sweep", inline=False)
+    if quotes:
+        cheapest = sorted(quotes.values(), key=lambda q: q.price)[:5]
         embed.add_field(
-            name=f"{alert['origin']} → {alert['destination']} on {date_str}",
-            value=f"Price: {price_info}{target}\nID: `{alert['id'][:8]}...`",
+            name="🏆 Cheapest",
+            value="\n".join(f"• {q.origin}→{q.destination} {q.date}: ${q.price:.2f}" for q in cheapest),
             inline=False
         )
+    embed.set_footer(text=f"{time.perf_counter() - start:.1f}s | {attempted} lookup(s) | Use !list to see your alerts")
     
     await ctx.send(embed=embed)
 
-@bot.command(name="remove")
-async def remove_alert_cmd(ctx, alert_id: str):
-    """Remove an alert by ID (first 8 chars)."""
-    user = get_or_create_user(ctx.author.id, str(ctx.author))
-    alerts = get_user_alerts(user['id'])
+class AlertPages(discord.ui.View):
+    """Previous/Next buttons for !list. Each page is one keyset query."""
+    
+    def __init__(self, author_id, user_id, rows):
+        super().__init__(timeout=LIST_TIMEOUT_SECONDS)
+        self.author_id = author_id
+        self.user_id = user_id
+        self.cursors = [None]  # keyset position where each page so far starts
+        self.rows = rows  # current page plus one row, if there is a next page
+        self.message = None
+        self.update_buttons()
+    
+    def embed(self):
+        embed = discord.Embed(title="✈️ Your Flight Alerts", color=0x00aaff)
+        for alert in self.rows[:LIST_PAGE_SIZE]:
+            date_str = alert['departureDate'].strftime("%Y-%m-%d")
+            price_info = f"${alert['lastPrice']:.2f}" if alert['lastPrice'] else "Checking..."
+            target = f" | Target: ${alert['maxPrice']:.2f}" if alert['maxPrice'] else ""
+            
+            embed.add_field(
+                name=f"{alert['origin']} → {alert['destination']} on {date_str}",
+                value=f"Price: {price_info}{target}\nID: `{alert['id'][:8]}...`",
+                inline=False
+            )
+        if not self.rows:
+            embed.description = "No more alerts."
+        if len(self.cursors) > 1 or len(self.rows) > LIST_PAGE_SIZE:
+            embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
     
-    # Find matching alert
-    matching = [a for a in alerts if a['id'].startswith(alert_id)]
+    def update_buttons(self):
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = len(self.rows) <= LIST_PAGE_SIZE
     
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Run `!list` to page through your own alerts.", ephemeral=True)
+            return False
+        return True
+    
+    async def show_page(self, interaction):
+        self.rows = await get_user_alerts_page(self.user_id, LIST_PAGE_SIZE + 1, self.cursors[-1])
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+    
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        self.cursors.pop()
+        await self.show_page(interaction)
+    
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        last = self.rows[LIST_PAGE_SIZE - 1]
+        self.cursors.append((last['createdAt'], last['id']))
+        await self.show_page(interaction)
+    
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass  # message deleted
+
+@bot.command(name="list")
+async def list_alerts(ctx):
+    """List your flight alerts, a page at a time."""
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
+    alerts = await get_user_alerts_page(user['id'], LIST_PAGE_SIZE + 1)
+    
+    if not alerts:
+        await ctx.send("No active alerts. Use `!track` to add one!")
+        return
+    
+    pages = AlertPages(ctx.author.id, user['id'], alerts)
+    if len(alerts) <= LIST_PAGE_SIZE:
+        await ctx.send(embed=pages.embed())
+        return
+    pages.message = await ctx.send(embed=pages.embed(), view=pages)
+
+async def find_alert(ctx, user, alert_id):
+    """The user's alert whose ID starts with `alert_id`, or None after telling them why not."""
+    matching = await find_user_alerts(user['id'], alert_id)
     if not matching:
         await ctx.send(f"❌ No alert found starting with `{alert_id}`")
+        return None
+    if len(matching) > 1:
+        await ctx.send(f"❌ More than one alert starts with `{alert_id}`. Use more of the ID from `!list`.")
+        return None
+    return matching[0]
+
+@bot.command(name="remove")
+async def remove_alert_cmd(ctx, alert_id: str):
+    """Remove an alert by ID (first 8 chars)."""
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
+    alert = await find_alert(ctx, user, alert_id)
+    if alert is None:
         return
     
-    if remove_alert(matching[0]['id'], user['id']):
+    if await remove_alert(alert['id'], user['id']):
         await ctx.send(f"✅ Alert removed!")
     else:
         await ctx.send(f"❌ Could not remove alert")
@@ -472,8 +571,8 @@ async def remove_alert_cmd(ctx, alert_id: str):
 @bot.command(name="check")
 async def check_now(ctx):
     """Manually check prices."""
-    user = get_or_create_user(ctx.author.id, str(ctx.author))
-    alerts = get_user_alerts(user['id'])
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
+    alerts = await get_user_alerts(user['id'])
     
     if not alerts:
         await ctx.send("No alerts to check.")
@@ -481,42 +580,166 @@ async def check_now(ctx):
     
     await ctx.send("🔍 Checking prices...")
     
-    for alert in alerts:
+    lookups = await asyncio.gather(*(
+        get_flight_price(alert['origin'], alert['destination'], alert['departureDate'].strftime("%Y-%m-%d"),
+                         max_age=INTERACTIVE_MAX_AGE)
+        for alert in alerts
+    ))
+    
+    prices = [(alert['id'], flight_data.price) for alert, flight_data in zip(alerts, lookups) if flight_data]
+    if prices:
+        await bulk_update_last_prices(prices)
+        for alert_id, price in prices:
+            trend_cache.add(alert_id, price)
+    
+    for alert, flight_data in zip(alerts, lookups):
         date_str = alert['departureDate'].strftime("%Y-%m-%d")
-        flight_data = get_flight_price(alert['origin'], alert['destination'], date_str)
         
         if flight_data:
             old_price = alert['lastPrice']
-            update_last_price(alert['id'], flight_data['price'])
             
             change = ""
             if old_price:
-                diff = flight_data['price'] - old_price
+                diff = flight_data.price - old_price
                 if diff < 0:
                     change = f"📉 ${abs(diff):.2f} lower!"
                 elif diff > 0:
                     change = f"📈 ${diff:.2f} higher"
             
-            stops_text = "Nonstop" if flight_data['stops'] == 0 else f"{flight_data['stops']} stop(s)"
+            stops_text = flight_data.stops_text
             
             embed = discord.Embed(
                 title=f"✈️ {alert['origin']} → {alert['destination']}",
                 color=0x00aaff
             )
-            embed.add_field(name="💰 One-Way Price", value=f"**${flight_data['price']:.2f}**", inline=True)
-            embed.add_field(name="✈️ Airline", value=flight_data['airline'], inline=True)
-            embed.add_field(name="🕐 Departure", value=flight_data['departure_time'] or "N/A", inline=True)
-            embed.add_field(name="⏱️ Duration", value=flight_data['duration'] or "N/A", inline=True)
+            embed.add_field(name="💰 One-Way Price", value=f"**${flight_data.price:.2f}**", inline=True)
+            embed.add_field(name="✈️ Airline", value=flight_data.airline, inline=True)
+            embed.add_field(name="🕐 Departure", value=flight_data.departure_time or "N/A", inline=True)
+            embed.add_field(name="⏱️ Duration", value=flight_data.duration or "N/A", inline=True)
             embed.add_field(name="🛑 Stops", value=stops_text, inline=True)
             if change:
                 embed.add_field(name="📊 Change", value=change, inline=True)
-            embed.add_field(name="🔗 Book", value=f"[Google Flights]({flight_data['link']})", inline=False)
+            embed.add_field(name="🔗 Book", value=f"[Google Flights]({flight_data.link})", inline=False)
             embed.set_footer(text=f"Date: {date_str}")
             
             await ctx.send(embed=embed)
         else:
             await ctx.send(f"**{alert['origin']} → {alert['destination']}** ({date_str}): Could not fetch")
 
+SIGNALS = {
+    "buy": "🟢 **Buy** - near the bottom of its recent range",
+    "wait": "🟡 **Wait** - above average and trending down",
+    "watch": "⚪ **Watch** - no clear edge either way",
+    None: "Not enough history yet",
+}
+
+@bot.command(name="trend")
+async def trend_cmd(ctx, alert_id: str):
+    """Show price trend stats for an alert by ID (first 8 chars)."""
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
+    alert = await find_alert(ctx, user, alert_id)
+    if alert is None:
+        return
+    
+    trend = (await trend_cache.trends([alert['id']]))[alert['id']]
+    date_str = alert['departureDate'].strftime("%Y-%m-%d")
+    if trend is None:
+        await ctx.send(f"**{alert['origin']} → {alert['destination']}** ({date_str}): no prices recorded in the last {TREND_WINDOW_DAYS} days yet")
+        return
+    
+    embed = discord.Embed(
+        title=f"📈 {alert['origin']} → {alert['destination']} on {date_str}",
+        description=f"`{sparkline(trend_cache.history(alert['id']))}`",
+        color=0x00aaff
+    )
+    embed.add_field(name="💰 Current", value=f"**${trend.current:.2f}** ({trend.percentile:.0f}% of checks were cheaper)", inline=False)
+    embed.add_field(name=f"{TREND_ROLLING_DAYS}-Day Low / Mean", value=f"${trend.rolling_low:.2f} / ${trend.rolling_mean:.2f}", inline=True)
+    embed.add_field(name=f"{TREND_WINDOW_DAYS}-Day Low / Mean / High", value=f"${trend.low:.2f} / ${trend.mean:.2f} / ${trend.high:.2f}", inline=True)
+    
+    # Past the raw retention window, history survives as daily rollups
+    daily = await get_daily_prices(alert['id'])
+    span = (datetime.now().date() - daily[0]['day']).days if daily else 0
+    if span > TREND_WINDOW_DAYS:
+        low = min(day['minPrice'] for day in daily)
+        high = max(day['maxPrice'] for day in daily)
+        embed.add_field(name=f"📅 {span}-Day Low / High", value=f"${low:.2f} / ${high:.2f}", inline=True)
+    if trend.samples >= TREND_MIN_SAMPLES:
+        embed.add_field(name="📊 Volatility", value=f"{trend.volatility:.1%} per check", inline=True)
+        embed.add_field(name="↕️ Trend", value=f"{trend.slope:+.2%} per day", inline=True)
+    embed.add_field(name="🧭 Signal", value=SIGNALS[trend.signal], inline=False)
+    embed.set_footer(text=f"{trend.samples} prices over {trend.days:.0f} days | Not financial advice, just arithmetic")
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name="history")
+async def history_cmd(ctx):
+    """Show the price trend of your 25 newest alerts."""
+    user = await get_or_create_user(ctx.author.id, str(ctx.author))
+    alerts = await get_user_alerts_page(user['id'], 25)
+    
+    if not alerts:
+        await ctx.send("No active alerts. Use `!track` to add one!")
+        return
+    
+    # One history query and one vectorized pass for all of them
+    trends = await trend_cache.trends([alert['id'] for alert in alerts])
+    
+    embed = discord.Embed(title=f"📈 Price Trends ({TREND_WINDOW_DAYS} days)", color=0x00aaff)
+    for alert in alerts:
+        trend = trends[alert['id']]
+        date_str = alert['departureDate'].strftime("%Y-%m-%d")
+        if trend is None:
+            value = "No prices recorded yet"
+        else:
+            value = (
+                f"`{sparkline(trend_cache.history(alert['id']), 16)}` ${trend.current:.2f} "
+                f"(low ${trend.low:.2f}, mean ${trend.mean:.2f})\n{SIGNALS[trend.signal]}"
+            )
+        embed.add_field(
+            name=f"{alert['origin']} → {alert['destination']} on {date_str} · `{alert['id'][:8]}`",
+            value=value,
+            inline=False
+        )
+    embed.set_footer(text="Use !trend <id> for details")
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name="quota")
+@is_bot_admin()
+async def quota_status(ctx):
+    """Show SerpApi usage and budget (admin only)."""
+    stats = flights.client.limiter.stats()
+    
+    embed = discord.Embed(title="📊 SerpApi Quota", color=0x00aaff)
+    embed.add_field(name="This Month", value=f"{stats['month_used']}/{stats['monthly_limit']}", inline=True)
+    embed.add_field(name="Today", value=f"{stats['day_used']}/{stats['daily_limit']}", inline=True)
+    embed.add_field(name="Rate Limit", value=f"{stats['rate_per_second']:g}/s", inline=True)
+    
+    exhaustion = stats['projected_exhaustion']
+    embed.add_field(
+        name="Projected Exhaustion",
+        value=exhaustion.strftime("%Y-%m-%d %H:%M UTC") if exhaustion else "Lasts until monthly reset",
+        inline=False
+    )
+    embed.add_field(name="Deferred Sweep Checks", value=str(stats['deferred']), inline=True)
+    embed.add_field(
+        name="Waiting",
+        value=f"Interactive: {stats['waiting']['interactive']} | Background: {stats['waiting']['background']}",
+        inline=True
+    )
+    
+    breaker = flights.client.breaker
+    embed.add_field(
+        name="Provider Circuit",
+        value=f"{breaker.state} (retry in {breaker.retry_in():.0f}s)" if breaker.state != CLOSED else CLOSED,
+        inline=True
+    )
+    
+    cache = flights.client.cache.stats()
+    embed.set_footer(text=f"Cache hit rate: {cache['hit_rate']:.0%} ({cache['hits']} hits)")
+    
+    await ctx.send(embed=embed)
+
 @bot.command(name="flighthelp")
 async def flight_help(ctx):
     """Show help."""
@@ -532,68 +755,326 @@ async def flight_help(ctx):
     embed.add_field(name="!list", value="Show your alerts", inline=False)
     embed.add_field(name="!check", value="Check prices now", inline=False)
     embed.add_field(name="!remove <id>", value="Remove an alert", inline=False)
-    embed.add_field(name="💡 Tips", value="• NRT = Tokyo Narita, HND = Tokyo Haneda\n• Max 30 API calls per search\n• Prices are one-way", inline=False)
+    embed.add_field(name="!trend <id> / !history", value="Price trends and a buy/wait signal", inline=False)
+    embed.add_field(name="!import (attach CSV/JSON)", value="Track many routes at once: origin,destination,date,max_price", inline=False)
+    embed.add_field(name="💡 Tips", value=f"• NRT = Tokyo Narita, HND = Tokyo Haneda\n• Max {MAX_SEARCH_CALLS} API calls per search\n• Prices are one-way", inline=False)
     
     await ctx.send(embed=embed)
 
-@tasks.loop(minutes=CHECK_INTERVAL_MINUTES)
-async def check_prices():
-    """Background price checker."""
-    print("=== SCHEDULED PRICE CHECK ===", flush=True)
+def route_key(alert):
+    """Key identifying the SerpApi query an alert needs."""
+    date_str = alert['departureDate'].strftime("%Y-%m-%d")
+    return (alert['origin'].upper(), alert['destination'].upper(), date_str)
+
+def group_alerts_by_route(alerts):
+    """Group alerts sharing the same (origin, destination, date)."""
+    groups = {}
+    for alert in alerts:
+        groups.setdefault(route_key(alert), []).append(alert)
+    return groups
+
+def evaluate_alert(alert, price, trend=None):
+    """Return the notification reason for a new price, or None.
     
-    alerts = get_all_active_alerts()
+    Without enough history any 5% drop notifies. With a trend, the drop
+    needed scales with how much the route usually moves between checks,
+    and a new low for the trend window is called out.
+    """
+    if alert['maxPrice'] and price <= alert['maxPrice']:
+        return f"🎯 Hit your target of ${alert['maxPrice']:.2f}!"
+    threshold = trend.drop_threshold() if trend else DEFAULT_DROP
+    if alert['lastPrice'] and price < alert['lastPrice'] * (1 - threshold):
+        drop = alert['lastPrice'] - price
+        if trend and trend.samples >= TREND_MIN_SAMPLES and price < trend.low:
+            return f"📉 Dropped ${drop:.2f}, lowest in {trend.days:.0f} days!"
+        return f"📉 Dropped ${drop:.2f}!"
+    return None
+
+def alert_discord_id(alert):
+    """Discord user ID for an alert's owner, or None for web-only users."""
+    discord_id = alert['discordId']
+    if not discord_id and alert['name'] and alert['name'].startswith('discord:'):
+        discord_id = alert['name'].split(':')[1]  # user not backfilled yet
+    return int(discord_id) if discord_id else None
+
+async def check_alerts(alerts):
+    """Fetch prices for a batch of alerts, save them and send notifications.
     
-    for alert in alerts:
-        date_str = alert['departureDate'].strftime("%Y-%m-%d")
-        flight_data = get_flight_price(alert['origin'], alert['destination'], date_str)
+    Routes shared by several alerts are fetched once. Returns a dict of
+    alert id -> new price (None if no price was found), the set of
+    alert ids skipped because the SerpApi budget is reserved or its
+    circuit breaker is open, and the batch's trends (alert id -> Trend).
+    """
+    start = time.perf_counter()
+    
+    # Many users watch the same route and date, so fetch each one only once
+    groups = group_alerts_by_route(alerts)
+    writer = PriceWriter()
+    prices = {}
+    deferred = set()
+    
+    # History stats for the whole batch from one query and one vectorized pass
+    try:
+        trends = await trend_cache.trends([alert['id'] for alert in alerts])
+    except Exception as e:
+        # Fall back to the fixed drop rule rather than skip the batch
+        metrics.inc("errors_total", cause=f"trends_{type(e).__name__}")
+        print(f"Trend stats unavailable: {type(e).__name__}: {e}", flush=True)
+        trends = {}
+    
+    async def fetch_group(key):
+        try:
+            return key, await get_flight_price(*key, priority=BACKGROUND)
+        except (QuotaExceeded, ProviderUnavailable):
+            # Budget is low or SerpApi is failing; leave these for a later tick
+            deferred.update(alert['id'] for alert in groups[key])
+            return key, None
+    
+    # Lookups run concurrently; handle each route as soon as its quote arrives
+    for lookup in asyncio.as_completed([fetch_group(key) for key in groups]):
+        (origin, destination, date_str), flight_data = await lookup
+        group = groups[(origin, destination, date_str)]
         
         if not flight_data:
             continue
         
-        price = flight_data['price']
-        should_notify = False
-        reason = ""
-        
-        if alert['maxPrice'] and price <= alert['maxPrice']:
-            should_notify = True
-            reason = f"🎯 Hit your target of ${alert['maxPrice']:.2f}!"
-        elif alert['lastPrice'] and price < alert['lastPrice'] * 0.95:
-            should_notify = True
-            drop = alert['lastPrice'] - price
-            reason = f"📉 Dropped ${drop:.2f}!"
-        
-        update_last_price(alert['id'], price)
+        price = flight_data.price
         
-        if should_notify:
-            # Try Discord notification if user is from Discord
-            if alert['name'] and alert['name'].startswith('discord:'):
-                discord_id = int(alert['name'].split(':')[1])
-                try:
-                    user = await bot.fetch_user(discord_id)
-                    
-                    stops_text = "Nonstop" if flight_data['stops'] == 0 else f"{flight_data['stops']} stop(s)"
-                    
-                    embed = discord.Embed(
-                        title=f"🚨 Flight Alert: {alert['origin']} → {alert['destination']}",
-                        description=reason,
-                        color=0x00ff00
-                    )
-                    embed.add_field(name="💰 One-Way Price", value=f"**${price:.2f}**", inline=True)
-                    embed.add_field(name="✈️ Airline", value=flight_data['airline'], inline=True)
-                    embed.add_field(name="🕐 Departure", value=flight_data['departure_time'] or "N/A", inline=True)
-                    embed.add_field(name="⏱️ Duration", value=flight_data['duration'] or "N/A", inline=True)
-                    embed.add_field(name="🛑 Stops", value=stops_text, inline=True)
-                    embed.add_field(name="📅 Date", value=date_str, inline=True)
-                    embed.add_field(name="🔗 Book Now", value=f"[Google Flights]({flight_data['link']})", inline=False)
-                    
-                    await user.send(embed=embed)
-                except Exception as e:
-                    print(f"Could not DM user: {e}", flush=True)
+        for alert in group:
+            reason = evaluate_alert(alert, price, trends.get(alert['id']))
+            prices[alert['id']] = price
+            trend_cache.add(alert['id'], price)
+            
+            await writer.add(alert['id'], price)
+            
+            discord_id = alert_discord_id(alert)
+            if reason and discord_id:
+                notifier.add(discord_id, alert, flight_data, date_str, reason)
+    
+    # Hand each user's hits to the dispatcher as one message
+    notifier.flush()
+    await writer.flush()
+    
+    elapsed = time.perf_counter() - start
+    metrics.observe("sweep_batch_seconds", elapsed)
+    metrics.inc("alerts_checked_total", len(alerts) - len(deferred))
+    metrics.inc("alerts_deferred_total", len(deferred))
+    metrics.set_gauge("sweep_alerts_per_second", len(alerts) / elapsed if elapsed else 0)
+    
+    metrics.log_event(
+        "sweep_batch", "Checked alerts",
+        alerts=len(alerts), fetches=len(groups), saved_fetches=len(alerts) - len(groups),
+        deferred=len(deferred), seconds=round(elapsed, 3),
+        alerts_per_second=round(len(alerts) / elapsed, 1) if elapsed else None
+    )
+    if deferred:
+        print(f"Deferred {len(deferred)} alert(s): SerpApi budget reserved or circuit open", flush=True)
+    metrics.log_event(
+        "sweep_stats", "Sweep stats",
+        cache=flights.client.cache.stats(), notifications=notifier.stats(), db_pool=db.pool_stats()
+    )
+    return prices, deferred, trends
+
+def interval_volatility(trend):
+    """Volatility for an alert's next check interval, from the trend its batch already computed."""
+    return trend.interval_volatility() if trend else None
+
+scheduler = AlertScheduler()
+
+# Read at scrape time, so these always reflect the current objects
+metrics.register("quote_cache", lambda: flights.client.cache.stats())
+metrics.register("serpapi_quota", lambda: flights.client.limiter.stats())
+metrics.register("serpapi_circuit", lambda: flights.client.breaker.stats())
+metrics.register("db_pool", db.pool_stats)
+metrics.register("notifications", lambda: notifier.stats())
+metrics.register("trend_cache", trend_cache.stats)
+metrics.register("route_ledger", lambda: flights.client.ledger.stats() if flights.client.ledger else {})
+metrics.register("fair_scheduler", fair.stats)
+metrics.register("scheduler", lambda: {"alerts": len(scheduler), "loaded": scheduler.loaded})
+
+@tasks.loop(seconds=SCHEDULER_TICK_SECONDS)
+async def check_prices():
+    """Background price checker: checks each alert when it comes due."""
+    now = time.time()
+    
+    # Pick up new and removed alerts
+    if scheduler.refreshed_at is None or now - scheduler.refreshed_at >= ALERT_REFRESH_MINUTES * 60:
+        try:
+            with metrics.timer("alert_refresh"):
+                scheduler.begin_refresh(now)
+                async for chunk in iter_active_alerts():
+                    scheduler.add_alerts(chunk)
+                scheduler.end_refresh()
+        except Exception as e:
+            # refreshed_at is unchanged, so the next tick tries again; already queued alerts still run
+            metrics.inc("errors_total", cause=f"refresh_{type(e).__name__}")
+            print(f"Alert refresh failed: {type(e).__name__}: {e}", flush=True)
+        else:
+            loaded = scheduler.loaded
+            print(f"Scheduler: tracking {len(scheduler)} active alert(s)", flush=True)
+            if any(loaded.values()):
+                print(
+                    f"Scheduler: {loaded['resumed']} resumed from checkpoint, "
+                    f"{loaded['overdue']} overdue (spread over {SWEEP_WARMUP_MINUTES:g} min), "
+                    f"{loaded['new']} never checked",
+                    flush=True
+                )
+    
+    # Leave due alerts queued until SerpApi recovers
+    if flights.client.breaker.is_open:
+        print(f"Sweep paused: SerpApi circuit open, retry in {flights.client.breaker.retry_in():.0f}s", flush=True)
+        return
+    
+    # Cap each tick so an overdue backlog drains over several ticks
+    due = scheduler.pop_due(now, MAX_CHECKS_PER_TICK)
+    if not due:
+        return
+    
+    # The scheduler only keeps ids; read the rows now, skipping alerts removed since the refresh
+    try:
+        batch = await get_active_alerts_by_ids(due)
+    except Exception as e:
+        print(f"Could not load due alerts: {type(e).__name__}: {e}", flush=True)
+        scheduler.requeue(due, CHECK_MIN_MINUTES * 60, now)
+        return
+    for alert_id in set(due) - {alert['id'] for alert in batch}:
+        scheduler.discard(alert_id)
+    if not batch:
+        return
+    
+    print(f"=== SCHEDULED PRICE CHECK ({len(batch)} due) ===", flush=True)
+    
+    try:
+        prices, deferred, trends = await check_alerts(batch)
+    except Exception as e:
+        metrics.inc("errors_total", cause=f"sweep_{type(e).__name__}")
+        print(f"Price check failed: {type(e).__name__}: {e}", flush=True)
+        scheduler.requeue(due, CHECK_MIN_MINUTES * 60, time.time())
+        return
+    
+    now = time.time()
+    checkpoints = []
+    for alert in batch:
+        price = prices.get(alert['id'])
+        if price is None:
+            # No price, or deferred for budget or an open circuit; try again soon
+            delay = scheduler.reschedule(alert, now, CHECK_MIN_MINUTES * 60)
+        else:
+            alert['lastPrice'] = price
+            delay = scheduler.reschedule(alert, now, volatility=interval_volatility(trends.get(alert['id'])))
+        if delay is not None:
+            checkpoints.append((alert['id'], delay, alert['id'] not in deferred))
+    
+    # Persist progress so a restart resumes instead of re-checking everything
+    try:
+        await save_checkpoints(checkpoints)
+    except Exception as e:
+        # The in-memory schedule is already updated; only a restart would re-check these early
+        metrics.inc("errors_total", cause=f"checkpoint_{type(e).__name__}")
+        print(f"Saving checkpoints failed: {type(e).__name__}: {e}", flush=True)
 
 @check_prices.before_loop
 async def before_check():
     await bot.wait_until_ready()
 
+@tasks.loop(seconds=QUOTA_SHARE_SECONDS)
+async def share_quota_usage():
+    """Pool this process's SerpApi calls with every other replica's, so they share one budget."""
+    budget = flights.client.limiter.budget
+    calls = budget.take_unshared()
+    try:
+        month_used, day_used = await record_serpapi_usage(datetime.now(timezone.utc).date(), calls)
+    except Exception as e:
+        budget.unshared += calls  # retried on the next tick
+        print(f"Sharing SerpApi usage failed: {type(e).__name__}: {e}", flush=True)
+        return
+    budget.adopt_shared(month_used, day_used)
+
+@tasks.loop(hours=MAINTENANCE_INTERVAL_HOURS)
+async def price_history_maintenance():
+    """Deactivate past alerts, then roll up and expire old PriceHistory rows (one replica at a time)."""
+    try:
+        expired = await deactivate_expired_alerts()
+        metrics.inc("alerts_expired_total", expired)
+        print(f"Deactivated {expired} alert(s) past their departure date", flush=True)
+    except Exception as e:
+        print(f"Alert expiry failed: {type(e).__name__}: {e}", flush=True)
+    
+    try:
+        summary = await maintain_price_history()
+    except Exception as e:
+        print(f"PriceHistory maintenance failed: {type(e).__name__}: {e}", flush=True)
+        return
+    if summary is None:
+        print("PriceHistory maintenance running elsewhere, skipped", flush=True)
+    else:
+        print(f"PriceHistory maintenance: {summary}", flush=True)
+    
+    if ROUTE_LEDGER:
+        try:
+            pruned = await prune_route_quotes()
+            print(f"Route ledger: pruned {pruned} past route(s)", flush=True)
+        except Exception as e:
+            print(f"Route ledger pruning failed: {type(e).__name__}: {e}", flush=True)
+
+async def claim_and_check():
+    """Lease a batch of due alerts, check them and schedule their next check."""
+    if flights.client.breaker.is_open:
+        print(f"Sweep paused: SerpApi circuit open, retry in {flights.client.breaker.retry_in():.0f}s", flush=True)
+        return 0
+    
+    batch = await claim_due_alerts(WORKER_ID, MAX_CHECKS_PER_TICK, WORKER_LEASE_SECONDS)
+    if not batch:
+        return 0
+    
+    print(f"=== WORKER {WORKER_ID}: {len(batch)} alert(s) claimed ===", flush=True)
+    
+    prices, deferred, trends = await check_alerts(batch)
+    
+    schedule = []
+    for alert in batch:
+        price = prices.get(alert['id'])
+        if price is None:
+            # No price, or deferred for budget or an open circuit; try again soon
+            delay = CHECK_MIN_MINUTES * 60
+        else:
+            alert['lastPrice'] = price
+            delay = next_check_delay(alert, interval_volatility(trends.get(alert['id'])))
+        schedule.append((alert['id'], delay, alert['id'] not in deferred))
+    
+    await release_alerts(WORKER_ID, schedule)
+    return len(batch)
+
+async def run_worker():
+    """Sweep-only process. Run several to split the sweep between them.
+    
+    Uses the Discord REST API for DMs but never connects to the gateway,
+    so workers don't answer commands.
+    """
+    print(f"Starting sweep worker {WORKER_ID}", flush=True)
+    async with bot:
+        await bot.login(DISCORD_TOKEN)
+        await flights.client.sync_quota()
+        await metrics.start()
+        notifier.start()
+        share_quota_usage.start()
+        price_history_maintenance.start()
+        warmup_until = time.monotonic() + SWEEP_WARMUP_MINUTES * 60
+        
+        while True:
+            try:
+                checked = await claim_and_check()
+            except Exception as e:
+                metrics.inc("errors_total", cause=f"worker_{type(e).__name__}")
+                print(f"Worker error: {type(e).__name__}: {e}", flush=True)
+                checked = 0
+            
+            # Keep claiming while there is a backlog, but only one batch per
+            # tick during warm-up, so a restart doesn't burst through the
+            # alerts that came due while the workers were down
+            if checked < MAX_CHECKS_PER_TICK or time.monotonic() < warmup_until:
+                await asyncio.sleep(SCHEDULER_TICK_SECONDS)
+
 if __name__ == "__main__":
     if not DISCORD_TOKEN:
         print("Error: DISCORD_TOKEN not set", flush=True)
@@ -602,4 +1083,7 @@ if __name__ == "__main__":
         print("Error: DATABASE_URL not set", flush=True)
         exit(1)
     
-    bot.run(DISCORD_TOKEN)
\ No newline at end of file
+    if BOT_ROLE == "worker":
+        asyncio.run(run_worker())
+    else:
+        bot.run(DISCORD_TOKEN)
\ No newline at end of file
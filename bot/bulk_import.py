@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+import math
+import os
+from datetime import date, datetime
+
+# Configuration
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 2_000_000))
+IMPORT_MAX_ALERTS = int(os.getenv("IMPORT_MAX_ALERTS", 5000))
+
+# Accepted column / key names for each field
+FIELDS = {
+    "origin": ("origin", "from"),
+    "destination": ("destination", "to"),
+    "date": ("date", "departure_date", "departuredate"),
+    "max_price": ("max_price", "maxprice", "target", "price"),
+}
+
+
+class InvalidImport(ValueError):
+    """The file as a whole can't be read (wrong format, too big, no rows)."""
+
+
+def _records(data, filename):
+    """(position, record) pairs from a CSV or JSON import file, e.g. ("line 2", {...})."""
+    if len(data) > IMPORT_MAX_BYTES:
+        raise InvalidImport(f"File is larger than {IMPORT_MAX_BYTES // 1000} KB")
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise InvalidImport("File must be UTF-8 text")
+
+    if filename.lower().endswith(".json") or text.lstrip().startswith(("[", "{")):
+        try:
+            parsed = json.loads(text)
+        except ValueError as e:
+            raise InvalidImport(f"Invalid JSON: {e}")
+        if isinstance(parsed, dict):
+            parsed = parsed.get("alerts")
+        if not isinstance(parsed, list):
+            raise InvalidImport('JSON must be a list of routes or {"alerts": [...]}')
+        return [(f"entry {i}", item) for i, item in enumerate(parsed, 1)]
+
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise InvalidImport("CSV has no header row")
+    # Line numbers count the header, so they match what the user sees in an editor
+    return [(f"line {i}", row) for i, row in enumerate(reader, 2)]
+
+
+def _field(record, name):
+    keys = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+    for alias in FIELDS[name]:
+        value = keys.get(alias)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+
+def _airports(value):
+    codes = [code.strip().upper() for code in (value or "").split(",") if code.strip()]
+    if not codes or any(len(code) != 3 or not code.isalpha() for code in codes):
+        return None
+    return codes
+
+
+def parse_import(data, filename="", today=None):
+    """Validate a CSV or JSON file of routes to track.
+
+    Each record has origin, destination, date (YYYY-MM-DD) and an optional
+    max_price. Origin and destination may be comma-separated airport lists
+    (quote them in CSV), which expand to every combination like !track.
+
+    Returns (rows, errors, duplicates). `rows` is a list of (origin,
+    destination, date, max_price) with repeats removed, and `duplicates`
+    counts the repeats. `errors` lists "line N: problem" strings. Callers
+    import nothing unless it is empty. Raises InvalidImport if the file
+    can't be read at all.
+    """
+    today = today or date.today()
+    records = _records(data, filename)
+    if not records:
+        raise InvalidImport("File has no routes")
+
+    rows = {}
+    errors = []
+    duplicates = 0
+    for where, record in records:
+        if not isinstance(record, dict):
+            errors.append(f"{where}: expected an object with origin, destination and date")
+            continue
+
+        origins = _airports(_field(record, "origin"))
+        destinations = _airports(_field(record, "destination"))
+        departure = _field(record, "date")
+        max_price = _field(record, "max_price")
+
+        problems = []
+        if origins is None:
+            problems.append("origin must be 3-letter airport code(s)")
+        if destinations is None:
+            problems.append("destination must be 3-letter airport code(s)")
+        try:
+            if datetime.strptime(departure or "", "%Y-%m-%d").date() < today:
+                problems.append(f"date {departure} is in the past")
+        except ValueError:
+            problems.append("date must be YYYY-MM-DD")
+        if max_price is not None:
+            try:
+                max_price = float(max_price.lstrip("$"))
+                if not math.isfinite(max_price) or max_price <= 0:
+                    raise ValueError
+            except ValueError:
+                problems.append("max_price must be a positive number")
+        if problems:
+            errors.append(f"{where}: " + "; ".join(problems))
+            continue
+
+        for origin in origins:
+            for destination in destinations:
+                key = (origin, destination, departure)
+                if key in rows:
+                    duplicates += 1
+                else:
+                    rows[key] = (origin, destination, departure, max_price)
+
+    if len(rows) > IMPORT_MAX_ALERTS:
+        errors.append(f"{len(rows)} routes is more than the {IMPORT_MAX_ALERTS} allowed per import")
+    return list(rows.values()), errors, duplicates
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+
+
+class QuoteCache:
+    """In-process TTL cache for flight quotes with LRU eviction.
+
+    Entries live for `ttl` seconds. Callers that need fresher data pass a
+    smaller `max_age` to `get`; a too-old entry is treated as a miss for
+    that caller but kept for others until the TTL runs out.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (stored_at, quote)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, max_age=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, quote = entry
+        age = time.monotonic() - stored_at
+
+        if age > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if max_age is not None and age > max_age:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return quote
+
+    def put(self, key, quote, stored_at=None):
+        """Cache a quote. `stored_at` (time.monotonic()) back-dates one fetched earlier elsewhere."""
+        self._entries[key] = (time.monotonic() if stored_at is None else stored_at, quote)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,110 @@
+import time
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+class RetryableError(Exception):
+    """A provider failure worth retrying: timeout, connection error, 429 or 5xx."""
+
+    def __init__(self, cause, retry_after=None):
+        super().__init__(cause)
+        self.cause = cause
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fail fast while a provider keeps failing.
+
+    Opens after `failure_threshold` consecutive failed calls and rejects
+    calls for `reset_seconds`. Then it lets a single probe through
+    (half-open). A successful probe closes the breaker; a failed one
+    opens it again for twice as long, up to `max_reset_seconds`.
+    """
+
+    def __init__(self, name, failure_threshold, reset_seconds, max_reset_seconds=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_reset_seconds = max_reset_seconds or reset_seconds * 16
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._cooldown = reset_seconds
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        """True while calls are being rejected (before the cooldown ends)."""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self._cooldown
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed (0 if not open)."""
+        if self.state != OPEN:
+            return 0
+        return max(self._cooldown - (time.monotonic() - self._opened_at), 0)
+
+    def before_call(self):
+        """Raise ProviderUnavailable unless a call may go ahead."""
+        if self.state == OPEN:
+            if self.is_open:
+                self.rejected += 1
+                raise ProviderUnavailable(f"{self.name} circuit open, retry in {self.retry_in():.0f}s")
+            self._set_state(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise ProviderUnavailable(f"{self.name} circuit half-open, probe in progress")
+            self._probing = True
+
+    def release(self):
+        """Forget a call that ended without an outcome (e.g. cancelled) so a new probe may run."""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            self._cooldown = self.reset_seconds
+            self._set_state(CLOSED)
+
+    def record_failure(self, cause):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN:
+            self._cooldown = min(self._cooldown * 2, self.max_reset_seconds)
+            self._open(cause)
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open(cause)
+
+    def _open(self, cause):
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._set_state(OPEN, cause=cause, cooldown_seconds=self._cooldown)
+
+    def _set_state(self, state, **fields):
+        self.state = state
+        metrics.log_event(
+            "circuit_state", f"{self.name} circuit {state}",
+            breaker=self.name, state=state, failures=self.failures, **fields
+        )
+
+    def stats(self):
+        return {
+            "open": self.state == OPEN,
+            "half_open": self.state == HALF_OPEN,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in_seconds": self.retry_in(),
+        }
@@ -0,0 +1,595 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+import metrics
+
+# Configuration
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", 500))
+DB_WRITE_FLUSH_SECONDS = float(os.getenv("DB_WRITE_FLUSH_SECONDS", 5))
+DB_STREAM_CHUNK_SIZE = int(os.getenv("DB_STREAM_CHUNK_SIZE", 5000))
+# Alerts deactivated per transaction once their departure date has passed
+ALERT_EXPIRE_BATCH = int(os.getenv("ALERT_EXPIRE_BATCH", 5000))
+
+# One worker thread per pooled connection, so a worker never waits on the pool
+# for long and blocking psycopg2 calls never run on the Discord event loop.
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_pool = None
+_pool_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "acquired": 0,
+    "in_use": 0,
+    "wait_total": 0.0,
+    "wait_max": 0.0,
+    "queries": 0,
+    "commits": 0,
+}
+
+
+class CountingCursor(RealDictCursor):
+    """RealDictCursor that counts statements sent to the server."""
+
+    def execute(self, query, vars=None):
+        with _stats_lock:
+            _stats["queries"] += 1
+        return super().execute(query, vars)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            db_url = urlparse(DATABASE_URL)
+            _pool = ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                host=db_url.hostname,
+                port=db_url.port,
+                user=db_url.username,
+                password=db_url.password,
+                database=db_url.path[1:],
+                cursor_factory=CountingCursor
+            )
+    return _pool
+
+
+def _record_acquire(wait):
+    with _stats_lock:
+        _stats["acquired"] += 1
+        _stats["in_use"] += 1
+        _stats["wait_total"] += wait
+        _stats["wait_max"] = max(_stats["wait_max"], wait)
+
+
+def _record_release():
+    with _stats_lock:
+        _stats["in_use"] -= 1
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection. Commits on success, rolls back on error."""
+    start = time.monotonic()
+    _slots.acquire()
+    pool = _get_pool()
+    try:
+        conn = pool.getconn()
+        if conn.closed:
+            # Server dropped it while idle; replace with a fresh one
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+    _record_acquire(time.monotonic() - start)
+
+    try:
+        yield conn
+        conn.commit()
+        with _stats_lock:
+            _stats["commits"] += 1
+    except Exception as e:
+        metrics.inc("errors_total", cause=f"db_{type(e).__name__}")
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+        _record_release()
+        _slots.release()
+
+
+def offload(fn):
+    """Turn a blocking DB helper into a coroutine run on the DB worker threads."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Includes time queued for a DB thread, which is what callers wait on
+        with metrics.timer(f"db.{fn.__name__}"):
+            return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+    wrapper.sync = fn
+    return wrapper
+
+
+def pool_stats():
+    """Snapshot of pool size, connection wait times and round-trip counts."""
+    with _stats_lock:
+        acquired = _stats["acquired"]
+        return {
+            "min_size": DB_POOL_MIN,
+            "max_size": DB_POOL_MAX,
+            "in_use": _stats["in_use"],
+            "acquired": acquired,
+            "avg_wait_ms": (_stats["wait_total"] / acquired * 1000) if acquired else 0.0,
+            "max_wait_ms": _stats["wait_max"] * 1000,
+            "queries": _stats["queries"],
+            "commits": _stats["commits"],
+        }
+
+
+def close():
+    """Close all pooled connections."""
+    global _pool
+    _executor.shutdown(wait=False)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def new_id():
+    return str(uuid.uuid4())[:25]  # cuid-like
+
+
+@offload
+def get_or_create_user(discord_id, discord_name):
+    """Get or create a user by Discord ID."""
+    discord_id = str(discord_id)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM "User" WHERE "discordId" = %s', (discord_id,))
+        user = cursor.fetchone()
+
+        if not user:
+            # Create new user. Users from before the "discordId" column already
+            # own the placeholder email, so this also backfills their ID.
+            cursor.execute('''
+                INSERT INTO "User" (id, name, email, "discordId") VALUES (%s, %s, %s, %s)
+                ON CONFLICT (email) DO UPDATE SET "discordId" = EXCLUDED."discordId"
+                RETURNING *
+            ''', (new_id(), f"discord:{discord_id}", f"discord_{discord_id}@trackroth.local", discord_id))
+            user = cursor.fetchone()
+
+        return user
+
+
+@offload
+def add_alert(user_id, origin, destination, departure_date, max_price=None):
+    """Add a new flight alert."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO "Alert" (id, "userId", origin, destination, "departureDate", "maxPrice", "isActive", "createdAt", "updatedAt")
+            VALUES (%s, %s, %s, %s, %s, %s, true, NOW(), NOW())
+            RETURNING *
+        ''', (new_id(), user_id, origin.upper(), destination.upper(), departure_date, max_price))
+
+        return cursor.fetchone()
+
+
+@offload
+def add_alerts(user_id, rows):
+    """Add many alerts in one transaction.
+
+    `rows` are (origin, destination, departure_date, max_price). Routes the
+    user already has an active alert for are skipped. Returns the new
+    alerts with the columns the sweep uses.
+    """
+    if not rows:
+        return []
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        return execute_values(cursor, '''
+            INSERT INTO "Alert" (id, "userId", origin, destination, "departureDate", "maxPrice", "isActive", "createdAt", "updatedAt")
+            SELECT v.id, v.user_id, v.origin, v.destination, v.departure_date, v.max_price, true, NOW(), NOW()
+            FROM (VALUES %s) AS v(id, user_id, origin, destination, departure_date, max_price)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM "Alert" a
+                WHERE a."userId" = v.user_id AND a."isActive" = true AND a.origin = v.origin
+                  AND a.destination = v.destination AND a."departureDate" = v.departure_date
+            )
+            RETURNING id, origin, destination, "departureDate", "maxPrice", "lastPrice"
+        ''', [(new_id(), user_id, origin.upper(), destination.upper(), departure_date, max_price)
+              for origin, destination, departure_date, max_price in rows],
+            template="(%s, %s, %s, %s, %s::timestamp, %s::double precision)", page_size=1000, fetch=True)
+
+
+@offload
+def record_serpapi_usage(day, calls):
+    """Add `calls` to the shared "SerpApiUsage" counter for `day`.
+
+    Returns (month_used, day_used) summed over every process, for the
+    month containing `day`.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        if calls:
+            cursor.execute('''
+                INSERT INTO "SerpApiUsage" (day, calls) VALUES (%s, %s)
+                ON CONFLICT (day) DO UPDATE SET calls = "SerpApiUsage".calls + EXCLUDED.calls
+            ''', (day, calls))
+        cursor.execute('''
+            SELECT COALESCE(SUM(calls), 0) AS month_used,
+                   COALESCE(SUM(calls) FILTER (WHERE day = %s), 0) AS day_used
+            FROM "SerpApiUsage"
+            WHERE day >= date_trunc('month', %s::date) AND day <= %s
+        ''', (day, day, day))
+        row = cursor.fetchone()
+
+        return int(row['month_used']), int(row['day_used'])
+
+
+@offload
+def get_user_alerts(user_id):
+    """Get all active upcoming alerts for a user."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT * FROM "Alert"
+            WHERE "userId" = %s AND "isActive" = true AND "departureDate" >= CURRENT_DATE
+            ORDER BY "createdAt" DESC
+        ''', (user_id,))
+
+        return cursor.fetchall()
+
+
+@offload
+def get_user_alerts_page(user_id, limit, after=None):
+    """One keyset page of a user's active upcoming alerts, newest first.
+
+    `after` is the ("createdAt", id) of the last alert on the previous
+    page. Every page is a range scan of the user's slice of an index, so
+    its cost doesn't grow with the user's alert count or the page number.
+    """
+    keyset = 'AND ("createdAt", id) < (%s, %s)' if after else ''
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute(f'''
+            SELECT * FROM "Alert"
+            WHERE "userId" = %s AND "isActive" = true AND "departureDate" >= CURRENT_DATE {keyset}
+            ORDER BY "createdAt" DESC, id DESC
+            LIMIT %s
+        ''', (user_id, *(after or ()), limit))
+
+        return cursor.fetchall()
+
+
+@offload
+def find_user_alerts(user_id, prefix, limit=2):
+    """A user's active alerts whose id starts with `prefix`, at most `limit` of them.
+
+    Ask for two to tell a unique prefix from an ambiguous one.
+    """
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT * FROM "Alert"
+            WHERE "userId" = %s AND "isActive" = true AND id LIKE %s
+            ORDER BY id
+            LIMIT %s
+        ''', (user_id, pattern, limit))
+
+        return cursor.fetchall()
+
+
+@offload
+def get_active_alerts_page(after_id, limit):
+    """One keyset page of active alerts with owner info, ordered by id.
+
+    Selects only the columns the sweep uses, to keep rows small.
+    "nextCheckIn" is the seconds until the alert's saved next check
+    (negative if overdue, None if it has never been scheduled).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT a.id, a.origin, a.destination, a."departureDate", a."maxPrice", a."lastPrice",
+                   EXTRACT(EPOCH FROM a."nextCheckAt" - NOW())::float AS "nextCheckIn",
+                   u.name, u."discordId"
+            FROM "Alert" a
+            JOIN "User" u ON a."userId" = u.id
+            WHERE a."isActive" = true AND a."departureDate" >= CURRENT_DATE AND a.id > %s
+            ORDER BY a.id
+            LIMIT %s
+        ''', (after_id, limit))
+
+        return cursor.fetchall()
+
+
+@offload
+def get_active_alerts_by_ids(alert_ids):
+    """get_active_alerts_page's columns for the given alerts, skipping any no longer active."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT a.id, a.origin, a.destination, a."departureDate", a."maxPrice", a."lastPrice",
+                   u.name, u."discordId"
+            FROM "Alert" a
+            JOIN "User" u ON a."userId" = u.id
+            WHERE a.id = ANY(%s) AND a."isActive" = true AND a."departureDate" >= CURRENT_DATE
+        ''', (list(alert_ids),))
+
+        return cursor.fetchall()
+
+
+async def iter_active_alerts(chunk_size=DB_STREAM_CHUNK_SIZE):
+    """Stream all active alerts in fixed-size chunks.
+
+    Pages by id (keyset), so each query is cheap no matter how far in it
+    is. The next page is fetched while the caller processes the current one.
+    """
+    next_page = asyncio.ensure_future(get_active_alerts_page("", chunk_size))
+    try:
+        while next_page is not None:
+            page = await next_page
+            next_page = None
+            if len(page) == chunk_size:
+                next_page = asyncio.ensure_future(get_active_alerts_page(page[-1]['id'], chunk_size))
+            if page:
+                yield page
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+@offload
+def get_price_histories(since):
+    """PriceHistory rows newer than a per-alert cutoff.
+
+    `since` maps alert id -> epoch seconds. Returns alert id -> (checked-at
+    epoch seconds, prices), both oldest first. Alerts with no new rows are
+    left out.
+    """
+    if not since:
+        return {}
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        rows = execute_values(cursor, '''
+            SELECT h."alertId",
+                   array_agg(EXTRACT(EPOCH FROM h."checkedAt"::timestamptz)::float ORDER BY h."checkedAt") AS times,
+                   array_agg(h.price ORDER BY h."checkedAt") AS prices
+            FROM (VALUES %s) AS v(id, since)
+            JOIN "PriceHistory" h ON h."alertId" = v.id AND h."checkedAt" > to_timestamp(v.since)::timestamp
+            GROUP BY h."alertId"
+        ''', [(alert_id, float(ts)) for alert_id, ts in since.items()],
+            template="(%s, %s::double precision)", page_size=len(since), fetch=True)
+
+        return {row['alertId']: (row['times'], row['prices']) for row in rows}
+
+
+@offload
+def claim_due_alerts(worker_id, limit, lease_seconds):
+    """Lease up to `limit` due alerts to this worker.
+
+    Rows locked by another worker's claim are skipped, and alerts whose
+    lease has expired (e.g. the worker crashed) can be claimed again.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            WITH due AS (
+                SELECT id FROM "Alert"
+                WHERE "isActive" = true AND "departureDate" >= CURRENT_DATE
+                  AND ("nextCheckAt" IS NULL OR "nextCheckAt" <= NOW())
+                  AND ("leaseExpiresAt" IS NULL OR "leaseExpiresAt" < NOW())
+                ORDER BY "nextCheckAt" NULLS FIRST
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE "Alert" a
+            SET "leaseOwner" = %s, "leaseExpiresAt" = NOW() + make_interval(secs => %s)
+            FROM due, "User" u
+            WHERE a.id = due.id AND u.id = a."userId"
+            RETURNING a.*, u.name, u.email, u."discordId"
+        ''', (limit, worker_id, lease_seconds))
+
+        return cursor.fetchall()
+
+
+@offload
+def release_alerts(worker_id, schedule):
+    """Set each alert's next check time and drop this worker's lease.
+
+    `schedule` is a list of (alert_id, seconds until next check, checked),
+    where `checked` is False for alerts that were deferred rather than
+    checked. Alerts whose lease was taken over by another worker are left
+    alone.
+    """
+    if not schedule:
+        return
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        execute_values(cursor, '''
+            UPDATE "Alert" AS a
+            SET "nextCheckAt" = NOW() + make_interval(secs => v.delay),
+                "lastCheckedAt" = CASE WHEN v.checked THEN NOW() ELSE a."lastCheckedAt" END,
+                "leaseOwner" = NULL, "leaseExpiresAt" = NULL
+            FROM (VALUES %s) AS v(id, delay, checked, owner)
+            WHERE a.id = v.id AND a."leaseOwner" = v.owner
+        ''', [(alert_id, delay, checked, worker_id) for alert_id, delay, checked in schedule],
+            template="(%s, %s::double precision, %s::boolean, %s)", page_size=1000)
+
+
+@offload
+def save_checkpoints(schedule):
+    """Persist the in-process sweep's progress so a restart can resume it.
+
+    `schedule` has the same (alert_id, seconds until next check, checked)
+    entries as release_alerts(). Written once per tick for the whole batch.
+    """
+    if not schedule:
+        return
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        execute_values(cursor, '''
+            UPDATE "Alert" AS a
+            SET "nextCheckAt" = NOW() + make_interval(secs => v.delay),
+                "lastCheckedAt" = CASE WHEN v.checked THEN NOW() ELSE a."lastCheckedAt" END
+            FROM (VALUES %s) AS v(id, delay, checked)
+            WHERE a.id = v.id
+        ''', schedule, template="(%s, %s::double precision, %s::boolean)", page_size=1000)
+
+
+@offload
+def remove_alert(alert_id, user_id):
+    """Deactivate an alert."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE "Alert" SET "isActive" = false, "updatedAt" = NOW()
+            WHERE id = %s AND "userId" = %s
+        ''', (alert_id, user_id))
+
+        return cursor.rowcount > 0
+
+
+@offload
+def deactivate_expired_alerts(batch_size=ALERT_EXPIRE_BATCH):
+    """Deactivate alerts whose departure date has passed. Returns how many.
+
+    Runs in short batches, each its own transaction, so a large backlog
+    never holds many row locks at once. Rows locked by a concurrent
+    writer are skipped until the next run.
+    """
+    expired = 0
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        while True:
+            cursor.execute('''
+                UPDATE "Alert" SET "isActive" = false, "updatedAt" = NOW()
+                WHERE id IN (
+                    SELECT id FROM "Alert"
+                    WHERE "isActive" = true AND "departureDate" < CURRENT_DATE
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+            ''', (batch_size,))
+            conn.commit()
+            expired += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return expired
+
+
+@offload
+def update_last_price(alert_id, price):
+    """Update the last known price for an alert."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE "Alert" SET "lastPrice" = %s, "updatedAt" = NOW()
+            WHERE id = %s
+        ''', (price, alert_id))
+
+        # Also save to price history
+        cursor.execute('''
+            INSERT INTO "PriceHistory" (id, "alertId", price, "checkedAt")
+            VALUES (%s, %s, %s, NOW())
+        ''', (new_id(), alert_id, price))
+
+
+@offload
+def bulk_update_last_prices(rows):
+    """Record many (alert_id, price) results in one transaction.
+
+    Uses a single multi-row UPDATE of "Alert" and a multi-row INSERT into
+    "PriceHistory" instead of a statement pair per alert.
+    """
+    if not rows:
+        return
+
+    # UPDATE ... FROM picks an arbitrary row for duplicate ids; keep the latest
+    latest = dict(rows)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        execute_values(cursor, '''
+            UPDATE "Alert" AS a SET "lastPrice" = v.price, "updatedAt" = NOW()
+            FROM (VALUES %s) AS v(id, price)
+            WHERE a.id = v.id
+        ''', list(latest.items()), template="(%s, %s::double precision)", page_size=1000)
+
+        execute_values(cursor, '''
+            INSERT INTO "PriceHistory" (id, "alertId", price, "checkedAt") VALUES %s
+        ''', [(new_id(), alert_id, price) for alert_id, price in rows], template="(%s, %s, %s, NOW())", page_size=1000)
+
+
+class PriceWriter:
+    """Buffers price results and writes them with bulk_update_last_prices.
+
+    A batch is flushed once it reaches `batch_size` rows or when a row is
+    added more than `flush_interval` seconds after the previous flush.
+    Call flush() at the end of a sweep to write the remainder.
+    """
+
+    def __init__(self, batch_size=DB_WRITE_BATCH_SIZE, flush_interval=DB_WRITE_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._rows = []
+        self._last_flush = time.monotonic()
+
+    async def add(self, alert_id, price):
+        self._rows.append((alert_id, price))
+        if len(self._rows) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        rows, self._rows = self._rows, []
+        self._last_flush = time.monotonic()
+        if not rows:
+            return
+        try:
+            await bulk_update_last_prices(rows)
+            self.rows_written += len(rows)
+        except Exception as e:
+            print(f"Could not save {len(rows)} price(s): {type(e).__name__}: {e}", flush=True)
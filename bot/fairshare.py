@@ -0,0 +1,193 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+
+# Configuration
+# Commands one user can run at once; more wait in that user's queue
+USER_MAX_CONCURRENT = int(os.getenv("USER_MAX_CONCURRENT", 2))
+# Commands one user can have waiting before new ones are refused
+USER_MAX_QUEUED = int(os.getenv("USER_MAX_QUEUED", 3))
+# SerpApi lookups commands can have in flight at once, shared fairly between users
+FAIR_LOOKUP_SLOTS = int(os.getenv("FAIR_LOOKUP_SLOTS", 4))
+# Lookup shares for specific users, e.g. "1234:2,5678:0.5" (everyone else has 1)
+USER_WEIGHTS = {
+    int(user): float(weight)
+    for user, _, weight in (entry.partition(":") for entry in os.getenv("USER_WEIGHTS", "").split(","))
+    if user.strip() and float(weight or 0) > 0
+}
+# A new run of one of these commands stops the same user's previous run
+SUPERSEDED_COMMANDS = {name.strip() for name in os.getenv("SUPERSEDED_COMMANDS", "search,check").split(",") if name.strip()}
+
+# Discord user id of the command the current task is running, None for the sweep
+current_user = contextvars.ContextVar("current_user", default=None)
+
+
+class QueueFull(Exception):
+    """The user already has USER_MAX_QUEUED commands waiting."""
+
+
+class _UserState:
+    __slots__ = ("running", "queue", "latest", "finish")
+
+    def __init__(self):
+        self.running = 0
+        self.queue = deque()  # futures of waiting commands, oldest first
+        self.latest = {}  # command name -> task running the newest invocation
+        self.finish = 0.0  # virtual finish time of the user's last lookup
+
+
+class FairScheduler:
+    """Per-user admission for commands and weighted fair sharing of their lookups.
+
+    Each user runs at most `max_concurrent` commands; later ones queue
+    FIFO behind them, up to `max_queued`. A new run of a command in
+    `superseded` cancels the user's previous run of it.
+
+    Lookups made while a command runs take one of `lookup_slots` with
+    start-time fair queuing: each lookup is tagged with the user's
+    virtual finish time, which advances 1/weight per lookup, and the
+    lowest tag goes next. A user firing 30 lookups at once takes turns
+    with everyone else instead of going first. Lookups outside a command
+    (the sweep) aren't gated here; they have their own budget reserve.
+    """
+
+    def __init__(self, max_concurrent=USER_MAX_CONCURRENT, max_queued=USER_MAX_QUEUED,
+                 lookup_slots=FAIR_LOOKUP_SLOTS, weights=None, superseded=SUPERSEDED_COMMANDS):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.lookup_slots = lookup_slots
+        self.weights = USER_WEIGHTS if weights is None else weights
+        self.superseded = superseded
+        self._users = {}  # user id -> _UserState
+        self._lookup_waiters = []  # heap of (tag, seq, future)
+        self._lookups = 0
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self.superseded_count = 0
+        self.rejected = 0
+
+    async def enter(self, user_id, command):
+        """Wait for one of the user's command slots, then run as that user.
+
+        Returns True if this cancelled the user's previous run of the
+        command. Raises QueueFull if the user's queue is full. Every
+        successful enter() must be paired with leave().
+        """
+        state = self._users.setdefault(user_id, _UserState())
+        replaced = False
+        if command in self.superseded:
+            previous = state.latest.get(command)
+            if previous is not None and not previous.done():
+                # Cancelling a queued run cancels its waiter too, so it frees its queue spot now
+                previous.cancel()
+                replaced = True
+                self.superseded_count += 1
+                metrics.inc("commands_superseded_total", command=command)
+            state.latest[command] = asyncio.current_task()
+
+        while state.queue and state.queue[0].done():
+            state.queue.popleft()
+        if state.running < self.max_concurrent and not state.queue:
+            state.running += 1
+        else:
+            queued = sum(not waiter.done() for waiter in state.queue)
+            # A replacement may queue behind the run it cancelled, which is about to leave
+            if queued >= self.max_queued and not replaced:
+                self.rejected += 1
+                metrics.inc("commands_rejected_total", command=command)
+                raise QueueFull(f"{state.running} running and {queued} queued")
+
+            waiter = asyncio.get_running_loop().create_future()
+            state.queue.append(waiter)
+            start = time.perf_counter()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._next_command(user_id, state)  # granted a slot just as it was cancelled
+                raise
+            finally:
+                metrics.observe("command_queue_seconds", time.perf_counter() - start, command=command)
+
+        current_user.set(user_id)
+        return replaced
+
+    def leave(self, user_id, command):
+        """Free the slot taken by enter() and start the user's next queued command."""
+        state = self._users.get(user_id)
+        if state is None:
+            return
+        if state.latest.get(command) is asyncio.current_task():
+            del state.latest[command]
+        self._next_command(user_id, state)
+
+    def _next_command(self, user_id, state):
+        while state.queue:
+            waiter = state.queue.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes straight to the waiter
+                return
+        state.running -= 1
+        if not state.running and all(task.done() for task in state.latest.values()):
+            self._users.pop(user_id, None)
+
+    @asynccontextmanager
+    async def lookup(self):
+        """Hold a fair lookup slot for the current user while the block runs."""
+        user_id = current_user.get()
+        if user_id is None:
+            yield
+            return
+
+        state = self._users.setdefault(user_id, _UserState())
+        tag = max(self._vtime, state.finish)
+        state.finish = tag + 1 / self.weights.get(user_id, 1.0)
+
+        if self._lookups < self.lookup_slots and not self._lookup_waiters:
+            self._lookups += 1
+            self._vtime = tag
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._lookup_waiters, (tag, next(self._seq), waiter))
+            start = time.perf_counter()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._next_lookup()
+                raise
+            finally:
+                metrics.observe("lookup_queue_seconds", time.perf_counter() - start)
+
+        try:
+            yield
+        finally:
+            self._next_lookup()
+
+    def _next_lookup(self):
+        while self._lookup_waiters:
+            tag, _, waiter = heapq.heappop(self._lookup_waiters)
+            if not waiter.done():
+                self._vtime = tag
+                waiter.set_result(None)
+                return
+        self._lookups -= 1
+
+    def stats(self):
+        return {
+            "users": len(self._users),
+            "commands_running": sum(state.running for state in self._users.values()),
+            "commands_queued": sum(not waiter.done() for state in self._users.values() for waiter in state.queue),
+            "lookups_in_flight": self._lookups,
+            "lookups_queued": sum(not waiter.done() for _, _, waiter in self._lookup_waiters),
+            "lookup_slots": self.lookup_slots,
+            "superseded": self.superseded_count,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,427 @@
+import asyncio
+import os
+import random
+import time
+
+import aiohttp
+
+import metrics
+from cache import QuoteCache
+from circuit import CircuitBreaker, RetryableError
+from quotes import parse_flight, parse_grouped
+from quota import INTERACTIVE, QuotaBudget, QuotaExceeded, RateLimiter, TokenBucket
+
+# Configuration
+SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+SERPAPI_ACCOUNT_URL = os.getenv("SERPAPI_ACCOUNT_URL", "https://serpapi.com/account.json")
+SERPAPI_CONCURRENCY = int(os.getenv("SERPAPI_CONCURRENCY", 8))
+SERPAPI_TIMEOUT_SECONDS = float(os.getenv("SERPAPI_TIMEOUT_SECONDS", 30))
+SERPAPI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SERPAPI_CONNECT_TIMEOUT_SECONDS", 5))
+# Longest silence allowed while reading a response
+SERPAPI_READ_TIMEOUT_SECONDS = float(os.getenv("SERPAPI_READ_TIMEOUT_SECONDS", 20))
+# Retries for timeouts, connection errors, 429 and 5xx (full-jitter exponential backoff)
+SERPAPI_MAX_RETRIES = int(os.getenv("SERPAPI_MAX_RETRIES", 2))
+SERPAPI_RETRY_BASE_SECONDS = float(os.getenv("SERPAPI_RETRY_BASE_SECONDS", 0.5))
+SERPAPI_RETRY_MAX_SECONDS = float(os.getenv("SERPAPI_RETRY_MAX_SECONDS", 8))
+# Interactive lookups still waiting after this many seconds send a second request; 0 disables
+SERPAPI_HEDGE_AFTER_SECONDS = float(os.getenv("SERPAPI_HEDGE_AFTER_SECONDS", 0))
+# Consecutive failed lookups that open the circuit breaker, and how long it stays open
+SERPAPI_BREAKER_FAILURES = int(os.getenv("SERPAPI_BREAKER_FAILURES", 5))
+SERPAPI_BREAKER_RESET_SECONDS = float(os.getenv("SERPAPI_BREAKER_RESET_SECONDS", 60))
+SERPAPI_RATE_PER_SECOND = float(os.getenv("SERPAPI_RATE_PER_SECOND", 5))
+SERPAPI_BURST = int(os.getenv("SERPAPI_BURST", 10))
+SERPAPI_MONTHLY_QUOTA = int(os.getenv("SERPAPI_MONTHLY_QUOTA", 250))
+# Fixed daily cap; unset or 0 splits the monthly calls left evenly over the days left
+SERPAPI_DAILY_QUOTA = int(os.getenv("SERPAPI_DAILY_QUOTA", 0)) or None
+# Share of each budget the background sweep leaves for interactive commands
+SWEEP_BUDGET_RESERVE = float(os.getenv("SWEEP_BUDGET_RESERVE", 0.2))
+QUOTE_CACHE_TTL_SECONDS = float(os.getenv("QUOTE_CACHE_TTL_SECONDS", 1800))
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", 10000))
+# Interactive commands accept only quotes younger than this
+INTERACTIVE_MAX_AGE_SECONDS = float(os.getenv("INTERACTIVE_MAX_AGE_SECONDS", 300))
+# Next-best itineraries kept alongside each quote
+SERPAPI_ALTERNATIVES = int(os.getenv("SERPAPI_ALTERNATIVES", 3))
+# Fetch multi-airport lookups (SEA,PDX -> NRT,HND) with one comma-list request per date
+SERPAPI_GROUPED_QUERIES = int(os.getenv("SERPAPI_GROUPED_QUERIES", 1))
+
+
+class FlightClient:
+    """Non-blocking SerpApi client sharing one keep-alive connection pool.
+
+    At most `concurrency` requests are in flight at once; further callers
+    wait on a semaphore instead of opening more connections. Quotes are
+    cached, and concurrent requests for the same route share one fetch.
+    Every outbound call passes the circuit breaker, rate limiter and quota
+    budget first. With a `ledger` (ledger.RouteLedger), quotes other
+    processes fetched recently are reused before SerpApi is called. With
+    `fair` (fairshare.FairScheduler), lookups made for commands take turns
+    between users. A fetch is cancelled once every caller waiting on it is.
+    """
+
+    def __init__(self, api_key, url=SERPAPI_URL, concurrency=SERPAPI_CONCURRENCY, timeout=SERPAPI_TIMEOUT_SECONDS, cache=None, limiter=None, breaker=None, ledger=None, fair=None):
+        self.api_key = api_key
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout, connect=SERPAPI_CONNECT_TIMEOUT_SECONDS, sock_read=SERPAPI_READ_TIMEOUT_SECONDS
+        )
+        self.cache = cache or QuoteCache(QUOTE_CACHE_TTL_SECONDS, QUOTE_CACHE_SIZE)
+        self.limiter = limiter or RateLimiter(
+            TokenBucket(SERPAPI_RATE_PER_SECOND, SERPAPI_BURST),
+            QuotaBudget(SERPAPI_MONTHLY_QUOTA, SERPAPI_DAILY_QUOTA, SWEEP_BUDGET_RESERVE)
+        )
+        self.breaker = breaker or CircuitBreaker("SerpApi", SERPAPI_BREAKER_FAILURES, SERPAPI_BREAKER_RESET_SECONDS)
+        self.ledger = ledger
+        self.fair = fair
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+        self._inflight = {}
+        self._waiting = {}  # in-flight task -> callers awaiting it
+
+    def _get_session(self):
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def sync_quota(self):
+        """Seed the budget with this month's usage from the SerpApi account API."""
+        try:
+            async with self._get_session().get(SERPAPI_ACCOUNT_URL, params={"api_key": self.api_key}) as response:
+                account = await response.json(content_type=None)
+            self.limiter.budget.sync(account.get("this_month_usage", 0), account.get("searches_per_month"))
+            print(f"SerpApi quota: {self.limiter.budget.month_used}/{self.limiter.budget.monthly_limit} used this month", flush=True)
+        except Exception as e:
+            print(f"Could not sync SerpApi quota: {type(e).__name__}: {e}", flush=True)
+
+    async def get_flight_price(self, origin, destination, departure_date, currency="USD", max_age=None, priority=INTERACTIVE):
+        """Fetch a FlightQuote for a route, served from cache when fresh enough.
+
+        `max_age` (seconds) tightens the cache TTL for callers that want
+        fresher prices. Raises QuotaExceeded when the budget for `priority`
+        is used up, and ProviderUnavailable while the circuit breaker is open.
+        """
+        key = (origin.upper(), destination.upper(), departure_date, currency)
+        start = time.perf_counter()
+        source = "cache"
+
+        quote = self.cache.get(key, max_age=max_age)
+        if quote is None:
+            # Share an in-flight fetch for the same route instead of duplicating it
+            task, shared = self._join(key, lambda: self._fetch_shared(key, max_age, priority))
+            source = "shared" if shared else "fetch"
+            try:
+                quote, age = await self._wait_for(task)
+            finally:
+                metrics.observe("stage_seconds", time.perf_counter() - start, stage="get_flight_price", source=source)
+            if quote is None:
+                return None
+            self.cache.put(key, quote, stored_at=time.monotonic() - age)
+        else:
+            metrics.observe("stage_seconds", time.perf_counter() - start, stage="get_flight_price", source=source)
+
+        return quote
+
+    async def get_flight_prices(self, origins, destinations, departure_date, currency="USD", max_age=None, priority=INTERACTIVE,
+                                fallback=True):
+        """Quotes for every origin × destination pair on one date.
+
+        Returns {(origin, destination): FlightQuote or None}. Pairs missing
+        from the cache are fetched together in one multi-airport request, and
+        each itinerary is attributed to its pair by its airports. Pairs the
+        grouped response has nothing for, and pairs another poller is
+        fetching, fall back to single-pair lookups unless `fallback` is
+        False; then a grouped date costs one request.
+        """
+        origins = [o.upper() for o in origins]
+        destinations = [d.upper() for d in destinations]
+        pairs = [(o, d) for o in origins for d in destinations]
+
+        quotes = {}
+        missing = []
+        for pair in pairs:
+            quote = self.cache.get((*pair, departure_date, currency), max_age=max_age)
+            if quote is None:
+                missing.append(pair)
+            else:
+                quotes[pair] = quote
+
+        busy = []
+        if missing and self.ledger is not None:
+            # Pairs another poller fetched recently; the rest are claimed for this fetch
+            found, claimed = await self.ledger.claim([(*pair, departure_date, currency) for pair in missing], max_age)
+            for (origin, destination, _, _), (quote, age) in found.items():
+                # Keep the ledger quote's real age, so stricter callers don't take it as fresh
+                self.cache.put((origin, destination, departure_date, currency), quote, stored_at=time.monotonic() - age)
+                quotes[(origin, destination)] = quote
+            missing = [pair for pair in missing if pair not in quotes]
+            # Pairs another poller is fetching right now stay out of this fetch
+            busy = [pair for pair in missing if (*pair, departure_date, currency) not in claimed]
+            missing = [pair for pair in missing if (*pair, departure_date, currency) in claimed]
+
+        if len(missing) > 1 and SERPAPI_GROUPED_QUERIES:
+            group_origins = sorted({o for o, _ in missing})
+            group_destinations = sorted({d for _, d in missing})
+            key = (",".join(group_origins), ",".join(group_destinations), departure_date, currency)
+            start = time.perf_counter()
+            task, shared = self._join(key, lambda: self._fetch_group(group_origins, group_destinations, departure_date, currency, priority))
+            found = {}
+            try:
+                found = await self._wait_for(task)
+            finally:
+                metrics.observe("stage_seconds", time.perf_counter() - start, stage="get_flight_prices",
+                                source="shared" if shared else "fetch")
+                if self.ledger is not None:
+                    # Free the claims the response didn't price, so other pollers aren't kept waiting
+                    await self.ledger.release([(*pair, departure_date, currency) for pair in missing if pair not in found])
+
+            # Cache every pair the response covered, including ones not asked for this time
+            for pair, quote in found.items():
+                self.cache.put((*pair, departure_date, currency), quote)
+            if self.ledger is not None:
+                await self.ledger.publish({(*pair, departure_date, currency): quote for pair, quote in found.items()})
+            for pair in missing:
+                if pair in found:
+                    quotes[pair] = found[pair]
+            missing = [pair for pair in missing if pair not in found]
+            if missing and not fallback:
+                metrics.inc("grouped_fallbacks_skipped_total", len(missing))
+                missing = []
+            elif missing:
+                metrics.inc("grouped_fallbacks_total", len(missing))
+
+        if busy and not fallback:
+            metrics.inc("grouped_fallbacks_skipped_total", len(busy))
+        else:
+            # Single lookups wait for the other poller's quote before fetching themselves
+            missing += busy
+
+        if missing:
+            singles = await asyncio.gather(*(
+                self.get_flight_price(o, d, departure_date, currency, max_age, priority) for o, d in missing
+            ))
+            quotes.update(zip(missing, singles))
+
+        return {pair: quotes.get(pair) for pair in pairs}
+
+    async def _fetch_shared(self, key, max_age, priority):
+        """_fetch, reusing or claiming the route in the shared ledger first.
+
+        Returns (quote, age in seconds); the age is 0 unless the ledger had it.
+        """
+        if self.ledger is None:
+            return await self._fetch(*key, priority), 0.0
+
+        found, claimed = await self.ledger.claim([key], max_age)
+        if key in found:
+            return found[key]
+        if key not in claimed:
+            # Another poller is fetching this route; give it a moment
+            reused = await self.ledger.wait(key, max_age)
+            if reused is not None:
+                return reused
+
+        quote = None
+        try:
+            quote = await self._fetch(*key, priority)
+        finally:
+            if quote is not None:
+                await self.ledger.publish({key: quote})
+            else:
+                await self.ledger.release([key])
+        return quote, 0.0
+
+    def _join(self, key, fetch):
+        """The in-flight task for `key`, started with fetch() if there is none.
+
+        Returns (task, shared) where `shared` is True if it was already running.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            return task, True
+        task = asyncio.ensure_future(fetch())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task, False
+
+    async def _wait_for(self, task):
+        """Await a shared fetch, cancelling it if every caller waiting on it is cancelled."""
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiting[task] -= 1
+            if not self._waiting[task]:
+                del self._waiting[task]
+                if not task.done():
+                    metrics.inc("lookups_cancelled_total")
+                    task.cancel()
+
+    async def _request(self, origin, destination, departure_date, currency, priority):
+        """One SerpApi search, retried on transient failures. Returns the raw body or None.
+
+        `origin` and `destination` may be comma-separated airport lists.
+        Timeouts, connection errors, 429s and 5xx responses are retried up
+        to SERPAPI_MAX_RETRIES times with full-jitter exponential backoff.
+        Other responses, including SerpApi error bodies, are returned for the
+        parser to report. Raises ProviderUnavailable while the breaker is open.
+        """
+        params = {
+            "engine": "google_flights",
+            "departure_id": origin,
+            "arrival_id": destination,
+            "outbound_date": departure_date,
+            "currency": currency,
+            "hl": "en",
+            "type": "2",
+            "api_key": self.api_key
+        }
+        route = f"{origin} -> {destination} on {departure_date}"
+
+        self.breaker.before_call()
+        settled = False
+        try:
+            for attempt in range(SERPAPI_MAX_RETRIES + 1):
+                try:
+                    if priority == INTERACTIVE and SERPAPI_HEDGE_AFTER_SECONDS > 0:
+                        body = await self._hedged(params, priority, route)
+                    else:
+                        body = await self._attempt(params, priority, route)
+                except RetryableError as e:
+                    metrics.inc("errors_total", cause=f"serpapi_{e.cause}")
+                    if attempt == SERPAPI_MAX_RETRIES:
+                        settled = True
+                        self.breaker.record_failure(e.cause)
+                        print(f"SerpApi {e.cause} after {attempt + 1} attempt(s): {route}", flush=True)
+                        return None
+                    backoff = random.uniform(0, SERPAPI_RETRY_BASE_SECONDS * 2 ** attempt)
+                    delay = min(e.retry_after or backoff, SERPAPI_RETRY_MAX_SECONDS)
+                    metrics.inc("serpapi_retries_total", cause=e.cause)
+                    print(f"SerpApi {e.cause}, retrying in {delay:.1f}s: {route}", flush=True)
+                    await asyncio.sleep(delay)
+                    continue
+
+                settled = True
+                self.breaker.record_success()
+                return body
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            metrics.inc("errors_total", cause=f"serpapi_{type(e).__name__}")
+            print(f"Unexpected error: {type(e).__name__}: {e}", flush=True)
+            return None
+        finally:
+            if not settled:
+                self.breaker.release()
+
+    async def _attempt(self, params, priority, route):
+        """Send one request. Raises RetryableError for transient failures."""
+        if self.fair is None:
+            return await self._send(params, priority, route)
+        async with self.fair.lookup():
+            return await self._send(params, priority, route)
+
+    async def _send(self, params, priority, route):
+        try:
+            with metrics.timer("serpapi_rate_wait", priority=priority):
+                await self.limiter.acquire(priority)
+        except QuotaExceeded:
+            metrics.inc("errors_total", cause=f"quota_exceeded_{priority}")
+            raise
+
+        async with self._semaphore:
+            print(f"Searching flights: {route}", flush=True)
+            try:
+                with metrics.timer("serpapi_request"):
+                    async with self._get_session().get(self.url, params=params) as response:
+                        body = await response.read()
+            except asyncio.TimeoutError:
+                raise RetryableError("timeout")
+            except aiohttp.ClientError as e:
+                raise RetryableError(type(e).__name__)
+
+        if response.status == 429 or response.status >= 500:
+            retry_after = response.headers.get("Retry-After", "")
+            raise RetryableError(f"http_{response.status}", float(retry_after) if retry_after.isdigit() else None)
+        return body
+
+    async def _hedged(self, params, priority, route):
+        """Send a second request if the first is slow, and take whichever succeeds first.
+
+        The hedge costs an extra search, so it is only used for interactive lookups.
+        """
+        first = asyncio.ensure_future(self._attempt(params, priority, route))
+        pending = {first}
+        error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=SERPAPI_HEDGE_AFTER_SECONDS)
+            if done:
+                return first.result()
+
+            metrics.inc("serpapi_hedges_total", outcome="sent")
+            second = asyncio.ensure_future(self._attempt(params, priority, route))
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        metrics.inc("serpapi_hedges_total", outcome="hedge_won" if task is second else "primary_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fetch(self, origin, destination, departure_date, currency, priority):
+        body = await self._request(origin, destination, departure_date, currency, priority)
+        if body is None:
+            return None
+
+        try:
+            flight = parse_flight(body, origin, destination, departure_date, currency, SERPAPI_ALTERNATIVES)
+        except ValueError as e:
+            metrics.inc("errors_total", cause="serpapi_error")
+            print(f"SerpApi error: {e}", flush=True)
+            return None
+
+        if flight:
+            print(f"Found: ${flight.price} on {flight.airline} at {flight.departure_time}", flush=True)
+        else:
+            print("No flight data returned", flush=True)
+        return flight
+
+    async def _fetch_group(self, origins, destinations, departure_date, currency, priority):
+        body = await self._request(",".join(origins), ",".join(destinations), departure_date, currency, priority)
+        if body is None:
+            return {}
+
+        try:
+            found = parse_grouped(body, origins, destinations, departure_date, currency, SERPAPI_ALTERNATIVES)
+        except ValueError as e:
+            metrics.inc("errors_total", cause="serpapi_error")
+            print(f"SerpApi error: {e}", flush=True)
+            return {}
+
+        print(f"Grouped search found {len(found)}/{len(origins) * len(destinations)} route(s) on {departure_date}", flush=True)
+        return found
+
+
+client = FlightClient(SERPAPI_KEY)
+
+
+async def get_flight_price(origin, destination, departure_date, currency="USD", max_age=None, priority=INTERACTIVE):
+    """Fetch a quote through the shared client."""
+    return await client.get_flight_price(origin, destination, departure_date, currency, max_age, priority)
+
+
+async def get_flight_prices(origins, destinations, departure_date, currency="USD", max_age=None, priority=INTERACTIVE,
+                            fallback=True):
+    """Fetch quotes for every origin × destination pair through the shared client."""
+    return await client.get_flight_prices(origins, destinations, departure_date, currency, max_age, priority, fallback)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+from dataclasses import asdict
+
+from psycopg2.extras import execute_values
+
+import metrics
+from db import connection, offload
+from quotes import FlightQuote
+
+# Configuration
+# 0: don't share quotes through the RouteQuote table (each poller fetches on its own)
+ROUTE_LEDGER = int(os.getenv("ROUTE_LEDGER", 1))
+# Ledger quotes younger than this are reused instead of fetched again
+LEDGER_MAX_AGE_SECONDS = float(os.getenv("LEDGER_MAX_AGE_SECONDS", 1800))
+# How long a claimed route stays reserved for the poller fetching it
+LEDGER_CLAIM_SECONDS = float(os.getenv("LEDGER_CLAIM_SECONDS", 120))
+# How long to wait for another poller's fetch before fetching anyway
+LEDGER_WAIT_SECONDS = float(os.getenv("LEDGER_WAIT_SECONDS", 10))
+LEDGER_POLL_SECONDS = 1
+
+
+def quote_to_json(quote):
+    return json.dumps(asdict(quote))
+
+
+def quote_from_json(data):
+    """FlightQuote from a ledger row's quote column (written by the bot or lib/routeLedger.js)."""
+    if isinstance(data, str):
+        data = json.loads(data)
+    alternatives = tuple(quote_from_json(alternative) for alternative in data.get("alternatives") or ())
+    return FlightQuote(**{**data, "alternatives": alternatives})
+
+
+@offload
+def claim_route_quotes(keys, owner, max_age, claim_seconds):
+    """Reserve routes for fetching unless the ledger has a fresh quote.
+
+    `keys` are (origin, destination, date, currency). Returns (fresh,
+    claimed). `fresh` maps key -> (quote JSON, age in seconds) for quotes
+    younger than `max_age` seconds, and `claimed` is the set of keys this owner now
+    holds. Keys in neither are being fetched by another poller right now.
+    Claiming is an upsert that only takes over stale, unclaimed rows (or
+    the owner's own), so concurrent claimers of a route get one winner.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        claimed = execute_values(cursor, f'''
+            INSERT INTO "RouteQuote" AS q (origin, destination, date, currency, "claimedBy", "claimedUntil")
+            VALUES %s
+            ON CONFLICT (origin, destination, date, currency) DO UPDATE
+            SET "claimedBy" = EXCLUDED."claimedBy", "claimedUntil" = EXCLUDED."claimedUntil"
+            WHERE (q."fetchedAt" IS NULL OR q."fetchedAt" < NOW() - make_interval(secs => {float(max_age)}))
+              AND (q."claimedUntil" IS NULL OR q."claimedUntil" < NOW() OR q."claimedBy" = EXCLUDED."claimedBy")
+            RETURNING origin, destination, to_char(date, 'YYYY-MM-DD') AS date, currency
+        ''', [(*key, owner, claim_seconds) for key in keys],
+            template="(%s, %s, %s::date, %s, %s, NOW() + make_interval(secs => %s::double precision))",
+            page_size=len(keys), fetch=True)
+        claimed = {(row['origin'], row['destination'], row['date'], row['currency']) for row in claimed}
+
+        unclaimed = [key for key in keys if key not in claimed]
+        if not unclaimed:
+            return {}, claimed
+
+        fresh = execute_values(cursor, f'''
+            SELECT q.origin, q.destination, to_char(q.date, 'YYYY-MM-DD') AS date, q.currency, q.quote,
+                   EXTRACT(EPOCH FROM NOW() - q."fetchedAt")::float AS age
+            FROM "RouteQuote" q
+            JOIN (VALUES %s) AS v(origin, destination, date, currency)
+              ON q.origin = v.origin AND q.destination = v.destination AND q.date = v.date AND q.currency = v.currency
+            WHERE q."fetchedAt" >= NOW() - make_interval(secs => {float(max_age)}) AND q.quote IS NOT NULL
+        ''', unclaimed, template="(%s, %s, %s::date, %s)", page_size=len(unclaimed), fetch=True)
+
+        return {
+            (row['origin'], row['destination'], row['date'], row['currency']): (row['quote'], max(row['age'], 0.0))
+            for row in fresh
+        }, claimed
+
+
+@offload
+def publish_route_quotes(quotes, owner):
+    """Record fetched quotes ({key: FlightQuote}) and drop their claims."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        execute_values(cursor, '''
+            INSERT INTO "RouteQuote" (origin, destination, date, currency, price, quote, "fetchedAt", "fetchedBy")
+            VALUES %s
+            ON CONFLICT (origin, destination, date, currency) DO UPDATE
+            SET price = EXCLUDED.price, quote = EXCLUDED.quote, "fetchedAt" = EXCLUDED."fetchedAt",
+                "fetchedBy" = EXCLUDED."fetchedBy", "claimedBy" = NULL, "claimedUntil" = NULL
+        ''', [(*key, quote.price, quote_to_json(quote), owner) for key, quote in quotes.items()],
+            template="(%s, %s, %s::date, %s, %s, %s::jsonb, NOW(), %s)", page_size=1000)
+
+
+@offload
+def release_route_quotes(keys, owner):
+    """Drop this owner's claims on routes it could not price."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        execute_values(cursor, '''
+            UPDATE "RouteQuote" AS q SET "claimedBy" = NULL, "claimedUntil" = NULL
+            FROM (VALUES %s) AS v(origin, destination, date, currency, owner)
+            WHERE q.origin = v.origin AND q.destination = v.destination AND q.date = v.date
+              AND q.currency = v.currency AND q."claimedBy" = v.owner
+        ''', [(*key, owner) for key in keys], template="(%s, %s, %s::date, %s, %s)", page_size=1000)
+
+
+@offload
+def prune_route_quotes():
+    """Delete ledger rows for departure dates that have passed."""
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('DELETE FROM "RouteQuote" WHERE date < CURRENT_DATE')
+        return cursor.rowcount
+
+
+class RouteLedger:
+    """Latest quote per route in Postgres, shared with the web cron and other bot processes.
+
+    FlightClient asks the ledger before it calls SerpApi. A fresh quote
+    from any poller is reused. Otherwise the route is claimed, fetched and
+    published; if another poller holds the claim, the client waits briefly
+    for its result. Database errors are logged and treated as "go ahead
+    and fetch", so the ledger can only save calls, never lose a price.
+    """
+
+    def __init__(self, owner, max_age=LEDGER_MAX_AGE_SECONDS, claim_seconds=LEDGER_CLAIM_SECONDS,
+                 wait_seconds=LEDGER_WAIT_SECONDS):
+        self.owner = owner
+        self.max_age = max_age
+        self.claim_seconds = claim_seconds
+        self.wait_seconds = wait_seconds
+        self.reused = 0
+        self.claimed = 0
+        self.busy = 0
+        self.waited_out = 0
+        self.published = 0
+        self.errors = 0
+
+    def _error(self, action, e):
+        self.errors += 1
+        metrics.inc("errors_total", cause=f"ledger_{type(e).__name__}")
+        print(f"Route ledger {action} failed: {type(e).__name__}: {e}", flush=True)
+
+    async def claim(self, keys, max_age=None, count=True):
+        """Returns ({key: (FlightQuote, age in seconds)} reused from the ledger, set of keys to fetch)."""
+        max_age = min(max_age, self.max_age) if max_age is not None else self.max_age
+        try:
+            fresh, claimed = await claim_route_quotes(keys, self.owner, max_age, self.claim_seconds)
+        except Exception as e:
+            self._error("claim", e)
+            return {}, set(keys)
+
+        quotes = {}
+        for key, (data, age) in fresh.items():
+            try:
+                quotes[key] = (quote_from_json(data), age)
+            except (TypeError, ValueError) as e:
+                self._error("decode", e)
+        if count:
+            self.reused += len(quotes)
+            self.claimed += len(claimed)
+            self.busy += len(keys) - len(quotes) - len(claimed)
+        return quotes, claimed
+
+    async def wait(self, key, max_age=None):
+        """Poll for another poller's (quote, age) for `key`; None if it doesn't arrive in time."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_seconds
+        while loop.time() < deadline:
+            await asyncio.sleep(LEDGER_POLL_SECONDS)
+            quotes, claimed = await self.claim([key], max_age, count=False)
+            if key in quotes:
+                return quotes[key]
+            if key in claimed:
+                return None  # the other poller gave up; this one holds the claim now
+        self.waited_out += 1
+        return None
+
+    async def publish(self, quotes):
+        if not quotes:
+            return
+        try:
+            await publish_route_quotes(quotes, self.owner)
+            self.published += len(quotes)
+        except Exception as e:
+            self._error("publish", e)
+
+    async def release(self, keys):
+        if not keys:
+            return
+        try:
+            await release_route_quotes(list(keys), self.owner)
+        except Exception as e:
+            self._error("release", e)
+
+    def stats(self):
+        return {
+            "reused": self.reused,
+            "claimed": self.claimed,
+            "busy": self.busy,
+            "waited_out": self.waited_out,
+            "published": self.published,
+            "errors": self.errors,
+        }
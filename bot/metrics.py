@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from aiohttp import web
+
+# Configuration
+# Port for the Prometheus text endpoint (GET /metrics); 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# text: the usual console lines | json: one JSON object per event
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", 0.5))
+
+PREFIX = "trackroth_"
+# Seconds; covers cache hits (sub-ms) through slow SerpApi calls and whole sweeps
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# DB helpers record from worker threads, so every update takes the lock.
+# An update is a dict lookup and an add, cheap enough to leave on.
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_gauges = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+_collectors = {}  # name -> callable returning a stats dict
+_runner = None
+_lag_task = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter, e.g. inc("errors_total", cause="serpapi_timeout")."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """Record a duration in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        counts[-1] += seconds
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Time a block into the per-stage latency histogram.
+
+    Usable around awaits as well as blocking code.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+def register(name, collect):
+    """Export a stats() dict as gauges named trackroth_<name>_<key>, read at scrape time."""
+    _collectors[name] = collect
+
+
+def log_event(event, message=None, **fields):
+    """Log an event as a JSON line (LOG_FORMAT=json) or as readable text."""
+    if LOG_FORMAT == "json":
+        print(json.dumps({"ts": time.time(), "event": event, **fields}, default=str), flush=True)
+    else:
+        details = " ".join(f"{k}={v}" for k, v in fields.items())
+        print(f"{message or event}: {details}" if details else message or event, flush=True)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return None
+
+
+def _collected():
+    """Gauges from the registered stats() callables."""
+    gauges = []
+    for name, collect in list(_collectors.items()):
+        try:
+            stats = collect()
+        except Exception as e:
+            inc("errors_total", cause=f"collector_{name}")
+            print(f"Metrics collector {name} failed: {type(e).__name__}: {e}", flush=True)
+            continue
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                # e.g. {"waiting": {"interactive": 1, "background": 3}}
+                for sub, subvalue in value.items():
+                    if _number(subvalue) is not None:
+                        gauges.append((f"{name}_{key}", (("key", sub),), _number(subvalue)))
+            elif _number(value) is not None:
+                gauges.append((f"{name}_{key}", (), _number(value)))
+    return gauges
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, list(counts)) for key, counts in _histograms.items())
+
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for (name, labels), value in counters:
+        declare(name, "counter")
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    for (name, labels), value in gauges:
+        declare(name, "gauge")
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    for name, labels, value in sorted(_collected()):
+        declare(name, "gauge")
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    for (name, labels), counts in histograms:
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {counts[-1]}")
+        lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+async def _monitor_loop_lag(interval):
+    """Measure how late the event loop wakes a sleeping task."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        observe("event_loop_lag_seconds", lag)
+        set_gauge("event_loop_lag_last_seconds", lag)
+
+
+async def _handle_metrics(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start(host=METRICS_HOST, port=METRICS_PORT):
+    """Start the event-loop lag monitor and, if a port is set, the /metrics endpoint."""
+    global _runner, _lag_task
+    if _lag_task is None or _lag_task.done():
+        _lag_task = asyncio.create_task(_monitor_loop_lag(LOOP_LAG_INTERVAL_SECONDS))
+    if not port or _runner is not None:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    print(f"Metrics on http://{host}:{port}/metrics", flush=True)
+
+
+async def stop():
+    global _runner
+    if _lag_task is not None:
+        _lag_task.cancel()
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,159 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+import discord
+
+import metrics
+
+# Configuration
+NOTIFY_MIN_INTERVAL_SECONDS = float(os.getenv("NOTIFY_MIN_INTERVAL_SECONDS", 0.5))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 3))
+NOTIFY_USER_CACHE_SIZE = int(os.getenv("NOTIFY_USER_CACHE_SIZE", 10000))
+
+# Discord allows at most 25 fields per embed
+MAX_HITS_PER_EMBED = 25
+
+
+def alert_embed(hit):
+    """Full embed for a single price alert."""
+    alert, flight_data = hit['alert'], hit['flight_data']
+    stops_text = flight_data.stops_text
+
+    embed = discord.Embed(
+        title=f"🚨 Flight Alert: {alert['origin']} → {alert['destination']}",
+        description=hit['reason'],
+        color=0x00ff00
+    )
+    embed.add_field(name="💰 One-Way Price", value=f"**${flight_data.price:.2f}**", inline=True)
+    embed.add_field(name="✈️ Airline", value=flight_data.airline, inline=True)
+    embed.add_field(name="🕐 Departure", value=flight_data.departure_time or "N/A", inline=True)
+    embed.add_field(name="⏱️ Duration", value=flight_data.duration or "N/A", inline=True)
+    embed.add_field(name="🛑 Stops", value=stops_text, inline=True)
+    embed.add_field(name="📅 Date", value=hit['date'], inline=True)
+    embed.add_field(name="🔗 Book Now", value=f"[Google Flights]({flight_data.link})", inline=False)
+    return embed
+
+
+def summary_embeds(hits):
+    """Compact embeds listing several alerts, one field per alert."""
+    embeds = []
+    for i in range(0, len(hits), MAX_HITS_PER_EMBED):
+        chunk = hits[i:i + MAX_HITS_PER_EMBED]
+        embed = discord.Embed(title=f"🚨 {len(hits)} Flight Alerts", color=0x00ff00)
+        for hit in chunk:
+            alert, flight_data = hit['alert'], hit['flight_data']
+            stops_text = flight_data.stops_text
+            embed.add_field(
+                name=f"{alert['origin']} → {alert['destination']} on {hit['date']}",
+                value=(
+                    f"**${flight_data.price:.2f}** · {flight_data.airline} · {stops_text}\n"
+                    f"{hit['reason']} [Book]({flight_data.link})"
+                ),
+                inline=False
+            )
+        embeds.append(embed)
+    return embeds
+
+
+class NotificationDispatcher:
+    """Queue of outbound price-alert DMs, delivered by a background task.
+
+    The sweep adds hits and moves on; nothing it does waits on Discord.
+    Hits are held per user until flush(), then each user gets one message
+    (a summary embed when there are several hits). Sends are paced, and
+    429/5xx responses are retried with exponential backoff.
+    """
+
+    def __init__(self, bot, min_interval=NOTIFY_MIN_INTERVAL_SECONDS, max_retries=NOTIFY_MAX_RETRIES):
+        self.bot = bot
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._pending = {}  # discord id -> list of hits
+        self._queue = asyncio.Queue()
+        self._users = OrderedDict()
+        self._task = None
+
+    def add(self, discord_id, alert, flight_data, date_str, reason):
+        """Buffer an alert hit for a user until the next flush()."""
+        self._pending.setdefault(discord_id, []).append({
+            "alert": alert,
+            "flight_data": flight_data,
+            "date": date_str,
+            "reason": reason,
+        })
+
+    def flush(self):
+        """Queue one coalesced message per user with pending hits."""
+        pending, self._pending = self._pending, {}
+        for discord_id, hits in pending.items():
+            self._queue.put_nowait((discord_id, hits))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """Try to deliver what is queued, then stop the delivery task."""
+        self.flush()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Dropping {self._queue.qsize()} undelivered notification(s)", flush=True)
+        self._task.cancel()
+
+    async def _run(self):
+        while True:
+            discord_id, hits = await self._queue.get()
+            try:
+                await self._deliver(discord_id, hits)
+            except Exception as e:
+                self.failed += 1
+                metrics.inc("errors_total", cause="dm_failed")
+                print(f"Could not DM user {discord_id}: {type(e).__name__}: {e}", flush=True)
+            finally:
+                self._queue.task_done()
+            await asyncio.sleep(self.min_interval)
+
+    async def _get_user(self, discord_id):
+        user = self._users.get(discord_id) or self.bot.get_user(discord_id)
+        if user is None:
+            user = await self.bot.fetch_user(discord_id)
+        self._users[discord_id] = user
+        self._users.move_to_end(discord_id)
+        if len(self._users) > NOTIFY_USER_CACHE_SIZE:
+            self._users.popitem(last=False)
+        return user
+
+    async def _deliver(self, discord_id, hits):
+        user = await self._get_user(discord_id)
+        embeds = [alert_embed(hits[0])] if len(hits) == 1 else summary_embeds(hits)
+
+        for embed in embeds:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with metrics.timer("dm_send"):
+                        await user.send(embed=embed)
+                    self.sent += 1
+                    break
+                except discord.HTTPException as e:
+                    metrics.inc("errors_total", cause=f"discord_http_{e.status}")
+                    retryable = e.status == 429 or e.status >= 500
+                    if not retryable or attempt == self.max_retries:
+                        raise
+                    self.retried += 1
+                    await asyncio.sleep(getattr(e, "retry_after", None) or 2 ** attempt)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "pending_users": len(self._pending),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import calendar
+import time
+from datetime import datetime, timedelta, timezone
+
+# Priority classes for outbound SerpApi calls
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class QuotaExceeded(Exception):
+    """Raised when the SerpApi budget does not allow another call."""
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def take(self):
+        """Take a token. Returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class QuotaBudget:
+    """Daily and monthly SerpApi call accounting.
+
+    Background calls stop once less than `reserve` of either budget is
+    left, so the remainder stays available for interactive commands.
+    Without a fixed `daily_limit`, each day gets an even share of the
+    monthly calls left, spread over the days left in the month.
+    """
+
+    def __init__(self, monthly_limit, daily_limit, reserve):
+        self.monthly_limit = monthly_limit
+        self.fixed_daily = daily_limit
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.month_used = 0
+        self.day_used = 0
+        self.unshared = 0  # calls not yet added to the shared counter
+        self.deferred = 0
+        self._month = None
+        self._day = None
+        self._roll()
+
+    def _roll(self):
+        today = datetime.now(timezone.utc).date()
+        if (today.year, today.month) != self._month:
+            self._month = (today.year, today.month)
+            self.month_used = 0
+        if today != self._day:
+            self._day = today
+            self.day_used = 0
+            self._derive_daily()
+
+    def _derive_daily(self):
+        if self.fixed_daily:
+            self.daily_limit = self.fixed_daily
+            return
+        today = self._day
+        days_left = calendar.monthrange(today.year, today.month)[1] - today.day + 1
+        # Calls left when the day started, so today's own calls don't shrink today's limit
+        month_left = self.monthly_limit - (self.month_used - self.day_used)
+        self.daily_limit = max(1, month_left // days_left)
+
+    def allows(self, priority):
+        self._roll()
+        month_left = self.monthly_limit - self.month_used
+        day_left = self.daily_limit - self.day_used
+
+        if priority == BACKGROUND:
+            return month_left > self.monthly_limit * self.reserve and day_left > self.daily_limit * self.reserve
+        return month_left > 0 and day_left > 0
+
+    def record(self):
+        self._roll()
+        self.month_used += 1
+        self.day_used += 1
+        self.unshared += 1
+
+    def take_unshared(self):
+        """Calls made since the last share, which the caller now owns."""
+        calls, self.unshared = self.unshared, 0
+        return calls
+
+    def adopt_shared(self, month_used, day_used):
+        """Adopt totals across all processes (from the shared counter, plus calls made since)."""
+        self._roll()
+        self.month_used = max(self.month_used, month_used + self.unshared)
+        self.day_used = max(self.day_used, day_used + self.unshared)
+        self._derive_daily()
+
+    def sync(self, month_used, monthly_limit=None):
+        """Adopt usage reported by the provider (e.g. after a restart)."""
+        self._roll()
+        self.month_used = max(self.month_used, month_used)
+        if monthly_limit:
+            self.monthly_limit = monthly_limit
+        self._derive_daily()
+
+    def projected_exhaustion(self):
+        """When the monthly budget runs out at the current burn rate, or None."""
+        now = datetime.now(timezone.utc)
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        elapsed = (now - month_start).total_seconds()
+        if not self.month_used or elapsed <= 0:
+            return None
+
+        per_second = self.month_used / elapsed
+        exhausted_at = now + timedelta(seconds=max(0, self.monthly_limit - self.month_used) / per_second)
+        days_in_month = calendar.monthrange(now.year, now.month)[1]
+
+        if exhausted_at >= month_start + timedelta(days=days_in_month):
+            return None  # lasts until the monthly reset
+        return exhausted_at
+
+    def stats(self):
+        self._roll()
+        return {
+            "month_used": self.month_used,
+            "monthly_limit": self.monthly_limit,
+            "day_used": self.day_used,
+            "daily_limit": self.daily_limit,
+            "deferred": self.deferred,
+            "projected_exhaustion": self.projected_exhaustion(),
+        }
+
+
+class RateLimiter:
+    """Gate in front of every SerpApi call.
+
+    Combines a token bucket for the request rate with the quota budget.
+    While interactive callers are waiting, background callers yield to
+    them, so user commands are served first.
+    """
+
+    def __init__(self, bucket, budget):
+        self.bucket = bucket
+        self.budget = budget
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    async def acquire(self, priority=INTERACTIVE):
+        if not self.budget.allows(priority):
+            if priority == BACKGROUND:
+                self.budget.deferred += 1
+            raise QuotaExceeded(f"SerpApi {priority} budget exhausted")
+
+        self.waiting[priority] += 1
+        try:
+            while True:
+                if priority == BACKGROUND and self.waiting[INTERACTIVE]:
+                    await asyncio.sleep(1 / self.bucket.rate)
+                    continue
+                wait = self.bucket.take()
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            self.waiting[priority] -= 1
+
+        # Budget may have been used up by others while we waited
+        if not self.budget.allows(priority):
+            if priority == BACKGROUND:
+                self.budget.deferred += 1
+            raise QuotaExceeded(f"SerpApi {priority} budget exhausted")
+        self.budget.record()
+
+    def stats(self):
+        return {**self.budget.stats(), "rate_per_second": self.bucket.rate, "waiting": dict(self.waiting)}
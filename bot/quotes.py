@@ -0,0 +1,140 @@
+from dataclasses import dataclass, replace
+
+try:
+    # Noticeably faster on large SerpApi payloads; the stdlib parser works too
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+
+@dataclass(frozen=True, slots=True)
+class FlightQuote:
+    """One priced itinerary for a route and date.
+
+    Immutable, so cached quotes can be shared between callers. `alternatives`
+    holds the next-best itineraries from the same response.
+    """
+    origin: str
+    destination: str
+    date: str
+    price: float
+    airline: str
+    departure_time: str
+    arrival_time: str
+    duration_minutes: int
+    stops: int
+    currency: str = "USD"
+    alternatives: tuple = ()
+
+    @property
+    def duration(self):
+        if not self.duration_minutes:
+            return ""
+        return f"{self.duration_minutes // 60}h {self.duration_minutes % 60}m"
+
+    @property
+    def stops_text(self):
+        return "Nonstop" if self.stops == 0 else f"{self.stops} stop(s)"
+
+    @property
+    def link(self):
+        # Simple Google Flights search link (one-way)
+        return (
+            "https://www.google.com/travel/flights?q=one%20way%20flights%20from%20"
+            f"{self.origin}%20to%20{self.destination}%20on%20{self.date}&curr={self.currency}"
+        )
+
+
+def _quote(flight, origin, destination, departure_date, currency):
+    price = flight.get("price")
+    if not price:
+        return None
+
+    legs = flight.get("flights") or ()
+    if legs:
+        airline = legs[0].get("airline", "Unknown")
+        departure_time = legs[0].get("departure_airport", {}).get("time", "")
+        arrival_time = legs[-1].get("arrival_airport", {}).get("time", "")
+    else:
+        airline, departure_time, arrival_time = "Unknown", "", ""
+
+    return FlightQuote(
+        origin=origin,
+        destination=destination,
+        date=departure_date,
+        price=float(price),
+        airline=airline,
+        departure_time=departure_time,
+        arrival_time=arrival_time,
+        duration_minutes=int(flight.get("total_duration") or 0),
+        stops=max(len(legs) - 1, 0),
+        currency=currency,
+    )
+
+
+def parse_quotes(data, origin, destination, departure_date, currency="USD", limit=4):
+    """Up to `limit` quotes from a SerpApi google_flights response.
+
+    Quotes keep the response order (best_flights, then other_flights).
+    Only the fields FlightQuote needs are read; layovers, emissions,
+    booking tokens etc. are never touched.
+    """
+    quotes = []
+    for section in ("best_flights", "other_flights"):
+        for flight in data.get(section) or ():
+            quote = _quote(flight, origin, destination, departure_date, currency)
+            if quote:
+                quotes.append(quote)
+                if len(quotes) == limit:
+                    return quotes
+    return quotes
+
+
+def _load(body):
+    data = loads(body) if isinstance(body, (bytes, str)) else body
+    if "error" in data:
+        raise ValueError(data["error"])
+    return data
+
+
+def parse_flight(body, origin, destination, departure_date, currency="USD", alternatives=3):
+    """Parse a raw SerpApi response body into the leading FlightQuote, or None.
+
+    The next `alternatives` itineraries are attached to it.
+    """
+    data = _load(body)
+
+    quotes = parse_quotes(data, origin, destination, departure_date, currency, alternatives + 1)
+    if not quotes:
+        return None
+
+    return replace(quotes[0], alternatives=tuple(quotes[1:]))
+
+
+def parse_grouped(body, origins, destinations, departure_date, currency="USD", alternatives=3):
+    """Split a multi-airport response into {(origin, destination): FlightQuote}.
+
+    Each itinerary is attributed to the airports of its first departure
+    and last arrival. Pairs outside the requested sets are ignored, and
+    pairs the response has no itinerary for are missing from the result.
+    """
+    data = _load(body)
+    origins, destinations = set(origins), set(destinations)
+
+    found = {}
+    for section in ("best_flights", "other_flights"):
+        for flight in data.get(section) or ():
+            legs = flight.get("flights") or ()
+            if not legs:
+                continue
+            pair = (legs[0].get("departure_airport", {}).get("id"), legs[-1].get("arrival_airport", {}).get("id"))
+            if pair[0] not in origins or pair[1] not in destinations:
+                continue
+            quotes = found.setdefault(pair, [])
+            if len(quotes) > alternatives:
+                continue
+            quote = _quote(flight, pair[0], pair[1], departure_date, currency)
+            if quote:
+                quotes.append(quote)
+
+    return {pair: replace(quotes[0], alternatives=tuple(quotes[1:])) for pair, quotes in found.items() if quotes}
@@ -0,0 +1,160 @@
+import os
+import re
+from datetime import date, timedelta
+
+from db import connection, offload
+
+# Configuration
+# Raw PriceHistory rows older than this are compacted into daily rollups and dropped
+PRICE_HISTORY_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RETENTION_DAYS", 90))
+PRICE_HISTORY_MONTHS_AHEAD = int(os.getenv("PRICE_HISTORY_MONTHS_AHEAD", 3))
+# Batch size for row deletes when PriceHistory is not partitioned
+PRICE_HISTORY_DELETE_BATCH = int(os.getenv("PRICE_HISTORY_DELETE_BATCH", 10000))
+
+# Arbitrary key for pg_try_advisory_lock so only one replica runs maintenance
+MAINTENANCE_LOCK_KEY = 0x7472686D  # "trhm"
+PARTITION_NAME = re.compile(r"^PriceHistory_p(\d{4})(\d{2})$")
+
+
+def month_start(day, offset=0):
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _is_partitioned(cursor):
+    cursor.execute('''
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'PriceHistory' AND c.relnamespace = current_schema()::regnamespace
+    ''')
+    return cursor.fetchone() is not None
+
+
+def _rollup(cursor, cutoff):
+    """Fold raw rows before `cutoff` into per-alert daily min/max/last rollups.
+
+    Only whole days are aggregated (cutoff is a date), so re-running over
+    days already rolled up recomputes the same values.
+    """
+    cursor.execute('''
+        INSERT INTO "PriceHistoryDaily" ("alertId", day, "minPrice", "maxPrice", "lastPrice", samples)
+        SELECT "alertId", "checkedAt"::date, min(price), max(price),
+               (array_agg(price ORDER BY "checkedAt" DESC))[1], count(*)
+        FROM "PriceHistory"
+        WHERE "checkedAt" < %s
+        GROUP BY "alertId", "checkedAt"::date
+        ON CONFLICT ("alertId", day) DO UPDATE SET
+            "minPrice" = EXCLUDED."minPrice",
+            "maxPrice" = EXCLUDED."maxPrice",
+            "lastPrice" = EXCLUDED."lastPrice",
+            samples = EXCLUDED.samples
+    ''', (cutoff,))
+    return cursor.rowcount
+
+
+def _ensure_partitions(cursor, today, months_ahead):
+    """Create monthly partitions from this month through `months_ahead` months out."""
+    for offset in range(months_ahead + 1):
+        start, end = month_start(today, offset), month_start(today, offset + 1)
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "PriceHistory_p{start:%Y%m}" PARTITION OF "PriceHistory" FOR VALUES FROM (%s) TO (%s)',
+            (start, end)
+        )
+
+
+def _drop_expired_partitions(cursor, cutoff):
+    """Drop monthly partitions that end on or before `cutoff`. Returns their names."""
+    cursor.execute('''
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'PriceHistory' AND p.relnamespace = current_schema()::regnamespace
+    ''')
+    dropped = []
+    for row in cursor.fetchall():
+        match = PARTITION_NAME.match(row['relname'])
+        if not match:
+            continue  # e.g. the default partition
+        start = date(int(match.group(1)), int(match.group(2)), 1)
+        if month_start(start, 1) <= cutoff:
+            cursor.execute(f'DROP TABLE "{row["relname"]}"')
+            dropped.append(row['relname'])
+    return dropped
+
+
+@offload
+def maintain_price_history(retention_days=PRICE_HISTORY_RETENTION_DAYS, months_ahead=PRICE_HISTORY_MONTHS_AHEAD):
+    """Roll up and expire old PriceHistory rows.
+
+    Partitioned tables (see prisma/sql/price_history_partitioning.sql) get
+    future partitions created and expired ones dropped whole. Otherwise the
+    old rows are deleted in batches. Returns a summary dict, or None if
+    another process holds the maintenance lock.
+    """
+    today = date.today()
+    cutoff = today - timedelta(days=retention_days)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked", (MAINTENANCE_LOCK_KEY,))
+        if not cursor.fetchone()['locked']:
+            return None
+
+        try:
+            summary = {"cutoff": cutoff, "rolled_up_days": _rollup(cursor, cutoff)}
+
+            if _is_partitioned(cursor):
+                _ensure_partitions(cursor, today, months_ahead)
+                summary["dropped_partitions"] = _drop_expired_partitions(cursor, cutoff)
+                conn.commit()
+            else:
+                # Commit the rollup before deleting, then delete in short transactions
+                conn.commit()
+                deleted = 0
+                while True:
+                    cursor.execute('''
+                        DELETE FROM "PriceHistory" WHERE ctid IN (
+                            SELECT ctid FROM "PriceHistory" WHERE "checkedAt" < %s LIMIT %s
+                        )
+                    ''', (cutoff, PRICE_HISTORY_DELETE_BATCH))
+                    conn.commit()
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < PRICE_HISTORY_DELETE_BATCH:
+                        break
+                summary["deleted_rows"] = deleted
+            return summary
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_KEY,))
+
+
+@offload
+def get_daily_prices(alert_id, days=365):
+    """Per-day min/max/last prices for an alert over the last `days` days.
+
+    Older days come from the rollup table; days still inside the raw
+    retention window are aggregated from PriceHistory via its
+    (alertId, checkedAt) index.
+    """
+    since = date.today() - timedelta(days=days)
+    cutoff = date.today() - timedelta(days=PRICE_HISTORY_RETENTION_DAYS)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT day, "minPrice", "maxPrice", "lastPrice", samples
+            FROM "PriceHistoryDaily"
+            WHERE "alertId" = %s AND day >= %s AND day < %s
+            UNION ALL
+            SELECT "checkedAt"::date, min(price), max(price),
+                   (array_agg(price ORDER BY "checkedAt" DESC))[1], count(*)
+            FROM "PriceHistory"
+            WHERE "alertId" = %s AND "checkedAt" >= GREATEST(%s, %s)
+            GROUP BY "checkedAt"::date
+            ORDER BY day
+        ''', (alert_id, since, cutoff, alert_id, since, cutoff))
+
+        return cursor.fetchall()
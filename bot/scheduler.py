@@ -0,0 +1,159 @@
+import heapq
+import math
+import os
+import random
+import time
+from datetime import date, datetime
+
+# Configuration
+# Check interval for an alert 30 days out with a flat price, far from its target
+CHECK_INTERVAL_MINUTES = int(os.getenv("CHECK_INTERVAL_MINUTES", 360))
+CHECK_MIN_MINUTES = int(os.getenv("CHECK_MIN_MINUTES", 60))
+CHECK_MAX_MINUTES = int(os.getenv("CHECK_MAX_MINUTES", 1440))
+# How strongly recent volatility (stddev of relative price changes) shortens the interval
+VOLATILITY_WEIGHT = float(os.getenv("VOLATILITY_WEIGHT", 10))
+# Alerts whose last price is within this fraction of the target are checked twice as often
+TARGET_PROXIMITY = float(os.getenv("TARGET_PROXIMITY", 0.1))
+# Alerts that came due while the bot was down are spread over this window after a restart
+SWEEP_WARMUP_MINUTES = float(os.getenv("SWEEP_WARMUP_MINUTES", 30))
+
+
+def days_to_departure(alert, today=None):
+    departure = alert['departureDate']
+    if isinstance(departure, datetime):
+        departure = departure.date()
+    return max((departure - (today or date.today())).days, 0)
+
+
+def next_check_delay(alert, volatility=None):
+    """Seconds until an alert should be checked again.
+
+    Scales CHECK_INTERVAL_MINUTES by sqrt(days to departure / 30), so
+    near-term flights are polled more often, then shortens it for volatile
+    routes and for prices close to the alert's target. Jittered by ±10%
+    so alerts drift apart instead of coming due together.
+    """
+    if alert['lastPrice'] is None:
+        minutes = CHECK_MIN_MINUTES
+    else:
+        minutes = CHECK_INTERVAL_MINUTES * math.sqrt(max(days_to_departure(alert), 1) / 30)
+
+        if volatility:
+            minutes /= 1 + VOLATILITY_WEIGHT * volatility
+
+        if alert['maxPrice']:
+            gap = (alert['lastPrice'] - alert['maxPrice']) / alert['maxPrice']
+            if gap <= TARGET_PROXIMITY:
+                minutes /= 2
+
+    minutes = min(max(minutes, CHECK_MIN_MINUTES), CHECK_MAX_MINUTES)
+    return minutes * 60 * random.uniform(0.9, 1.1)
+
+
+class AlertScheduler:
+    """Priority queue of alert ids ordered by their next check time.
+
+    Only (id, due) is kept per alert, so memory stays small at millions
+    of alerts; callers load the rows of due alerts when they pop them.
+    The heap may hold stale entries for rescheduled or removed alerts;
+    `_due` records each tracked alert's current due time and anything
+    else is skipped when popped.
+    """
+
+    def __init__(self):
+        self.refreshed_at = None
+        self._heap = []
+        self._due = {}  # alert id -> due timestamp (last one, while being checked)
+        self._seen = None
+        self._refresh_now = None
+        self.loaded = {"resumed": 0, "overdue": 0, "new": 0}
+
+    def __len__(self):
+        return len(self._due)
+
+    def begin_refresh(self, now=None):
+        """Start a sync that receives the active alerts in chunks via add_alerts()."""
+        self._refresh_now = now or time.time()
+        self._seen = set()
+        self.loaded = {"resumed": 0, "overdue": 0, "new": 0}
+
+    def add_alerts(self, alerts):
+        """Add or update a chunk of active alerts.
+
+        Alerts seen for the first time (e.g. at startup) resume from their
+        saved next check time. Those already overdue are spread over
+        SWEEP_WARMUP_MINUTES, and alerts never checked get a random point
+        within their interval, so a restart doesn't check everything in
+        one burst.
+        """
+        for alert in alerts:
+            self._seen.add(alert['id'])
+            if alert['id'] not in self._due:
+                self._push(alert['id'], self._first_due(alert))
+
+    def _first_due(self, alert):
+        next_check_in = alert['nextCheckIn']
+        if next_check_in is None:
+            self.loaded["new"] += 1
+            return self._refresh_now + random.uniform(0, next_check_delay(alert))
+        if next_check_in > 0:
+            self.loaded["resumed"] += 1
+            return self._refresh_now + next_check_in
+        self.loaded["overdue"] += 1
+        return self._refresh_now + random.uniform(0, SWEEP_WARMUP_MINUTES * 60)
+
+    def end_refresh(self):
+        """Drop alerts that were not seen since begin_refresh()."""
+        for alert_id in list(self._due):
+            if alert_id not in self._seen:
+                del self._due[alert_id]
+        self.refreshed_at = self._refresh_now
+        self._seen = None
+
+    def _push(self, alert_id, due):
+        self._due[alert_id] = due
+        heapq.heappush(self._heap, (due, alert_id))
+
+    def pop_due(self, now=None, limit=None):
+        """Remove and return the ids of up to `limit` alerts whose check is due.
+
+        They stay tracked until reschedule() or discard(), so a refresh
+        while they are being checked doesn't queue them again.
+        """
+        now = now or time.time()
+        batch = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(batch) < limit):
+            due, alert_id = heapq.heappop(self._heap)
+            if self._due.get(alert_id) != due:
+                continue
+            batch.append(alert_id)
+        return batch
+
+    def requeue(self, alert_ids, delay, now=None):
+        """Queue popped alerts again after `delay` seconds, e.g. when their rows couldn't be read."""
+        now = now or time.time()
+        for alert_id in alert_ids:
+            if alert_id in self._due:
+                self._push(alert_id, now + delay)
+
+    def discard(self, alert_id):
+        """Stop tracking an alert, e.g. one deactivated since it was queued."""
+        self._due.pop(alert_id, None)
+
+    def reschedule(self, alert, now=None, delay=None, volatility=None):
+        """Queue an alert's next check after `delay` seconds (default: its interval at `volatility`).
+
+        Returns the delay used, or None if the alert is no longer tracked.
+        """
+        if alert['id'] not in self._due:
+            return None  # removed while it was being checked
+        now = now or time.time()
+        delay = next_check_delay(alert, volatility) if delay is None else delay
+        self._push(alert['id'], now + delay)
+        return delay
+
+    def next_due(self):
+        """Timestamp of the earliest scheduled check, or None."""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
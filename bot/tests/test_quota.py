@@ -0,0 +1,35 @@
+import calendar
+from datetime import datetime, timezone
+
+from quota import BACKGROUND, INTERACTIVE, QuotaBudget
+
+
+def days_left():
+    today = datetime.now(timezone.utc).date()
+    return calendar.monthrange(today.year, today.month)[1] - today.day + 1
+
+
+def test_sync_raises_derived_daily_limit_with_monthly_limit():
+    budget = QuotaBudget(250, None, 0.2)
+    assert budget.daily_limit == max(1, 250 // days_left())
+
+    budget.sync(1000, 100000)
+
+    assert budget.monthly_limit == 100000
+    assert budget.daily_limit == max(1, (100000 - 1000) // days_left())
+    assert budget.allows(INTERACTIVE) and budget.allows(BACKGROUND)
+
+
+def test_sync_keeps_fixed_daily_limit():
+    budget = QuotaBudget(250, 8, 0.2)
+    budget.sync(0, 100000)
+    assert budget.daily_limit == 8
+
+
+def test_daily_calls_do_not_shrink_derived_daily_limit():
+    budget = QuotaBudget(100000, None, 0.2)
+    limit = budget.daily_limit
+    for _ in range(10):
+        budget.record()
+    budget.adopt_shared(budget.month_used, budget.day_used)
+    assert budget.daily_limit == limit
@@ -0,0 +1,306 @@
+import os
+import time
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from db import get_price_histories
+
+# Configuration
+# History the trend stats cover
+TREND_WINDOW_DAYS = int(os.getenv("TREND_WINDOW_DAYS", 30))
+# Rolling low/mean cover the most recent part of the window
+TREND_ROLLING_DAYS = int(os.getenv("TREND_ROLLING_DAYS", 7))
+TREND_CACHE_SIZE = int(os.getenv("TREND_CACHE_SIZE", 20000))
+# Cached histories pick up rows written by other processes this often
+TREND_REFRESH_SECONDS = int(os.getenv("TREND_REFRESH_SECONDS", 900))
+# Fewer observations than this fall back to the fixed drop rule
+TREND_MIN_SAMPLES = int(os.getenv("TREND_MIN_SAMPLES", 8))
+# A price at or below this percentile of the window is a "buy"
+TREND_BUY_PERCENTILE = float(os.getenv("TREND_BUY_PERCENTILE", 20))
+# A drop must exceed this many typical check-to-check moves to notify
+TREND_DROP_SIGMAS = float(os.getenv("TREND_DROP_SIGMAS", 2))
+
+DEFAULT_DROP = 0.05
+MIN_DROP = 0.02
+MAX_DROP = 0.15
+DAY = 86400
+BARS = "▁▂▃▄▅▆▇█"
+
+
+@dataclass(frozen=True, slots=True)
+class Trend:
+    """Price statistics for one alert over the trend window.
+
+    Prices are in the alert's currency. `volatility` is the stddev of
+    relative changes between consecutive checks, and `slope` the fitted
+    relative change per day (negative when prices are falling).
+    """
+
+    samples: int
+    days: float
+    current: float
+    low: float
+    high: float
+    mean: float
+    rolling_low: float
+    rolling_mean: float
+    volatility: float
+    slope: float
+    percentile: float
+
+    @property
+    def signal(self):
+        """buy, wait or watch, or None with too little history."""
+        if self.samples < TREND_MIN_SAMPLES:
+            return None
+        if self.percentile <= TREND_BUY_PERCENTILE:
+            return "buy"
+        if self.slope < 0 and self.current > self.mean:
+            return "wait"
+        return "watch"
+
+    def drop_threshold(self):
+        """Relative drop worth a notification, scaled to how much this route moves."""
+        if self.samples < TREND_MIN_SAMPLES or np.isnan(self.volatility):
+            return DEFAULT_DROP
+        return min(max(TREND_DROP_SIGMAS * self.volatility, MIN_DROP), MAX_DROP)
+
+    def interval_volatility(self):
+        """Volatility to shorten the check interval by, or None with too little history."""
+        if self.samples < TREND_MIN_SAMPLES or np.isnan(self.volatility):
+            return None
+        return self.volatility
+
+
+class PriceSeries:
+    """Growable (epoch seconds, price) arrays for one alert, oldest first.
+
+    Rows before `synced` were read from PriceHistory. Rows after it were
+    added locally by the sweep and are replaced on the next sync, once
+    the database has them too.
+    """
+
+    __slots__ = ("_times", "_prices", "_start", "_end", "synced", "synced_at")
+
+    def __init__(self, capacity=16):
+        self._times = np.empty(capacity)
+        self._prices = np.empty(capacity)
+        self._start = self._end = self.synced = 0
+        self.synced_at = None
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def times(self):
+        return self._times[self._start:self._end]
+
+    @property
+    def prices(self):
+        return self._prices[self._start:self._end]
+
+    def last_synced_time(self):
+        return self._times[self.synced - 1] if self.synced > self._start else None
+
+    def extend(self, times, prices):
+        count = len(times)
+        if self._end + count > len(self._times):
+            # Compact and grow geometrically, so appends stay amortized O(1)
+            size = len(self)
+            capacity = max(2 * (size + count), 16)
+            new_times, new_prices = np.empty(capacity), np.empty(capacity)
+            new_times[:size], new_prices[:size] = self.times, self.prices
+            self.synced -= self._start
+            self._times, self._prices, self._start, self._end = new_times, new_prices, 0, size
+        self._times[self._end:self._end + count] = times
+        self._prices[self._end:self._end + count] = prices
+        self._end += count
+
+    def sync(self, times, prices, now):
+        """Replace locally added rows with the newer rows read from PriceHistory."""
+        self._end = max(self.synced, self._start)
+        self.extend(times, prices)
+        self.synced = self._end
+        self.synced_at = now
+
+    def trim(self, cutoff):
+        """Drop observations older than `cutoff`."""
+        self._start += int(np.searchsorted(self.times, cutoff, side="left"))
+        self.synced = max(self.synced, self._start)
+
+
+def compute_trends(series, now=None):
+    """Trend stats for many alerts at once, as a dict of alert id -> Trend.
+
+    The histories are packed into one NaN-padded matrix with a row per
+    alert. Each statistic is then a single NumPy reduction across all
+    alerts rather than a Python loop per alert.
+    """
+    now = now or time.time()
+    ids = [alert_id for alert_id, s in series.items() if len(s)]
+    if not ids:
+        return {}
+
+    counts = np.array([len(series[alert_id]) for alert_id in ids])
+    prices = np.full((len(ids), counts.max()), np.nan)
+    times = np.full_like(prices, np.nan)
+    for row, alert_id in enumerate(ids):
+        prices[row, :counts[row]] = series[alert_id].prices
+        times[row, :counts[row]] = series[alert_id].times
+
+    rows = np.arange(len(ids))
+    current = prices[rows, counts - 1]
+    valid = ~np.isnan(prices)
+
+    # Rows with too few points give NaN here (e.g. one price has no volatility)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high, mean = np.nanmin(prices, axis=1), np.nanmax(prices, axis=1), np.nanmean(prices, axis=1)
+
+        recent = np.where(times >= now - TREND_ROLLING_DAYS * DAY, prices, np.nan)
+        rolling_low, rolling_mean = np.nanmin(recent, axis=1), np.nanmean(recent, axis=1)
+
+        changes = prices[:, 1:] / prices[:, :-1] - 1
+        volatility = np.nanstd(changes, axis=1, ddof=1)
+
+        # Least-squares slope of price against days, relative to the mean price
+        days = (times - now) / DAY
+        dx = days - np.nanmean(days, axis=1, keepdims=True)
+        dy = prices - mean[:, None]
+        slope = np.nansum(dx * dy, axis=1) / np.nansum(dx * dx, axis=1) / mean
+
+    percentile = 100.0 * np.sum(valid & (prices < current[:, None]), axis=1) / counts
+    span = (now - np.nanmin(times, axis=1)) / DAY
+
+    return {
+        alert_id: Trend(
+            samples=int(counts[row]),
+            days=float(span[row]),
+            current=float(current[row]),
+            low=float(low[row]),
+            high=float(high[row]),
+            mean=float(mean[row]),
+            rolling_low=float(rolling_low[row]),
+            rolling_mean=float(rolling_mean[row]),
+            volatility=float(volatility[row]),
+            slope=float(slope[row]),
+            percentile=float(percentile[row]),
+        )
+        for row, alert_id in enumerate(ids)
+    }
+
+
+def sparkline(prices, width=24):
+    """The most recent `width` prices as a row of Unicode bars."""
+    prices = np.asarray(prices)[-width:]
+    if not len(prices):
+        return ""
+    low, high = prices.min(), prices.max()
+    if high == low:
+        levels = np.zeros(len(prices), dtype=int)
+    else:
+        levels = np.rint((prices - low) / (high - low) * (len(BARS) - 1)).astype(int)
+    return "".join(BARS[level] for level in levels)
+
+
+class TrendCache:
+    """Per-alert price histories and their trends, kept in memory.
+
+    A history is read from PriceHistory on first use. After that it only
+    grows: the sweep appends each new price, and every
+    TREND_REFRESH_SECONDS the rows written since the last sync are read.
+    A computed Trend is reused until its alert gets a new price or it is
+    TREND_REFRESH_SECONDS old, so the window keeps moving for alerts whose
+    lookups fail. Alerts are evicted LRU, like the quote cache.
+    """
+
+    def __init__(self, window_days=TREND_WINDOW_DAYS, max_size=TREND_CACHE_SIZE,
+                 refresh_seconds=TREND_REFRESH_SECONDS):
+        self.window_days = window_days
+        self.max_size = max_size
+        self.refresh_seconds = refresh_seconds
+        self._series = OrderedDict()  # alert id -> PriceSeries
+        self._trends = {}  # alert id -> (Trend, computed-at epoch seconds)
+        self.hits = 0
+        self.computed = 0
+        self.synced_rows = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._series)
+
+    async def trends(self, alert_ids):
+        """Trend (or None without history) for each alert id.
+
+        Histories that are new or due a refresh are read in one query,
+        and the trends that changed are computed in one batch.
+        """
+        now = time.time()
+        cutoff = now - self.window_days * DAY
+        since = {}
+        for alert_id in alert_ids:
+            series = self._series.get(alert_id)
+            if series is None:
+                series = self._series[alert_id] = PriceSeries()
+            self._series.move_to_end(alert_id)
+            if series.synced_at is None or now - series.synced_at >= self.refresh_seconds:
+                since[alert_id] = series.last_synced_time() or cutoff
+        self._evict()
+
+        if since:
+            histories = await get_price_histories(since)
+            for alert_id in since:
+                series = self._series.get(alert_id)
+                if series is None:
+                    continue  # evicted while the query ran
+                times, prices = histories.get(alert_id, ((), ()))
+                series.sync(times, prices, now)
+                self.synced_rows += len(times)
+                self._trends.pop(alert_id, None)
+
+        stale = {}
+        for alert_id in alert_ids:
+            cached = self._trends.get(alert_id)
+            if cached is not None and now - cached[1] < self.refresh_seconds:
+                self.hits += 1
+            elif alert_id in self._series:
+                self._trends.pop(alert_id, None)  # replaced below unless the window is now empty
+                series = self._series[alert_id]
+                series.trim(cutoff)
+                stale[alert_id] = series
+        fresh = compute_trends(stale, now)
+        self.computed += len(stale)
+        self._trends.update((alert_id, (trend, now)) for alert_id, trend in fresh.items())
+        return {alert_id: self._trends[alert_id][0] if alert_id in self._trends else None for alert_id in alert_ids}
+
+    def history(self, alert_id):
+        """Cached prices for an alert, oldest first (empty if not loaded)."""
+        series = self._series.get(alert_id)
+        return series.prices.copy() if series is not None else np.empty(0)
+
+    def add(self, alert_id, price, checked_at=None):
+        """Append a new price to a cached history. Uncached alerts load theirs on first use."""
+        series = self._series.get(alert_id)
+        if series is None:
+            return
+        series.extend((checked_at or time.time(),), (price,))
+        self._trends.pop(alert_id, None)
+
+    def _evict(self):
+        while len(self._series) > self.max_size:
+            alert_id, _ = self._series.popitem(last=False)
+            self._trends.pop(alert_id, None)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "alerts": len(self._series),
+            "max_size": self.max_size,
+            "trend_hits": self.hits,
+            "trends_computed": self.computed,
+            "synced_rows": self.synced_rows,
+            "evictions": self.evictions,
+        }
@@ -1,11 +1,14 @@
-export async function getFlightPrice(origin, destination, departureDate) {
+// Cheapest itinerary for a route, in the shape the Discord bot stores in
+// "RouteQuote".quote (bot/quotes.py FlightQuote), so either side can reuse
+// the other's quotes.
+export async function getFlightQuote(origin, destination, departureDate, currency = 'USD') {
   try {
     const params = new URLSearchParams({
       engine: 'google_flights',
       departure_id: origin.toUpperCase(),
       arrival_id: destination.toUpperCase(),
       outbound_date: departureDate,
-      currency: 'USD',
+      currency,
       hl: 'en',
       type: '2', // One-way
       api_key: process.env.SERPAPI_KEY,
@@ -20,14 +23,33 @@ export async function getFlightPrice(origin, destination, departureDate) {
     }
 
     const flights = data.best_flights || data.other_flights || []
-    
-    if (flights.length > 0 && flights[0].price) {
-      return parseFloat(flights[0].price)
+    const flight = flights[0]
+
+    if (!flight || !flight.price) {
+      return null
     }
 
-    return null
+    const legs = flight.flights || []
+    return {
+      origin: origin.toUpperCase(),
+      destination: destination.toUpperCase(),
+      date: departureDate,
+      price: parseFloat(flight.price),
+      airline: legs[0]?.airline || 'Unknown',
+      departure_time: legs[0]?.departure_airport?.time || '',
+      arrival_time: legs[legs.length - 1]?.arrival_airport?.time || '',
+      duration_minutes: parseInt(flight.total_duration || 0, 10),
+      stops: Math.max(legs.length - 1, 0),
+      currency,
+      alternatives: [],
+    }
   } catch (error) {
     console.error('Flight price fetch error:', error)
     return null
   }
 }
+
+export async function getFlightPrice(origin, destination, departureDate) {
+  const quote = await getFlightQuote(origin, destination, departureDate)
+  return quote ? quote.price : null
+}
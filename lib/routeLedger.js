@@ -0,0 +1,95 @@
+import { randomUUID } from 'crypto'
+import prisma from './prisma'
+import { getFlightQuote } from './flights'
+
+// Shared "RouteQuote" ledger, also used by the Discord bot (bot/ledger.py).
+// A route either side fetched within MAX_AGE_SECONDS is reused. Otherwise
+// the route is claimed first, so two pollers don't fetch it at once.
+const MAX_AGE_SECONDS = Number(process.env.LEDGER_MAX_AGE_SECONDS || 1800)
+const CLAIM_SECONDS = Number(process.env.LEDGER_CLAIM_SECONDS || 120)
+
+// Each lookup claims under its own id. Container and serverless instances
+// often share a pid, so a pid-based id would let two runs win one claim.
+function newOwner() {
+  return `web-${randomUUID()}`
+}
+
+async function claimRoute(owner, origin, destination, date, currency) {
+  const claimed = await prisma.$queryRaw`
+    INSERT INTO "RouteQuote" AS q (origin, destination, date, currency, "claimedBy", "claimedUntil")
+    VALUES (${origin}, ${destination}, ${date}::date, ${currency}, ${owner},
+            NOW() + make_interval(secs => ${CLAIM_SECONDS}::double precision))
+    ON CONFLICT (origin, destination, date, currency) DO UPDATE
+    SET "claimedBy" = EXCLUDED."claimedBy", "claimedUntil" = EXCLUDED."claimedUntil"
+    WHERE (q."fetchedAt" IS NULL OR q."fetchedAt" < NOW() - make_interval(secs => ${MAX_AGE_SECONDS}::double precision))
+      AND (q."claimedUntil" IS NULL OR q."claimedUntil" < NOW() OR q."claimedBy" = EXCLUDED."claimedBy")
+    RETURNING 1
+  `
+  if (claimed.length > 0) {
+    return { claimed: true }
+  }
+
+  const fresh = await prisma.$queryRaw`
+    SELECT quote FROM "RouteQuote"
+    WHERE origin = ${origin} AND destination = ${destination} AND date = ${date}::date AND currency = ${currency}
+      AND "fetchedAt" >= NOW() - make_interval(secs => ${MAX_AGE_SECONDS}::double precision) AND quote IS NOT NULL
+  `
+  return fresh.length > 0 ? { quote: fresh[0].quote } : { busy: true }
+}
+
+async function publishQuote(owner, quote) {
+  await prisma.$executeRaw`
+    INSERT INTO "RouteQuote" (origin, destination, date, currency, price, quote, "fetchedAt", "fetchedBy")
+    VALUES (${quote.origin}, ${quote.destination}, ${quote.date}::date, ${quote.currency}, ${quote.price},
+            ${JSON.stringify(quote)}::jsonb, NOW(), ${owner})
+    ON CONFLICT (origin, destination, date, currency) DO UPDATE
+    SET price = EXCLUDED.price, quote = EXCLUDED.quote, "fetchedAt" = EXCLUDED."fetchedAt",
+        "fetchedBy" = EXCLUDED."fetchedBy", "claimedBy" = NULL, "claimedUntil" = NULL
+  `
+}
+
+async function releaseRoute(owner, origin, destination, date, currency) {
+  await prisma.$executeRaw`
+    UPDATE "RouteQuote" SET "claimedBy" = NULL, "claimedUntil" = NULL
+    WHERE origin = ${origin} AND destination = ${destination} AND date = ${date}::date
+      AND currency = ${currency} AND "claimedBy" = ${owner}
+  `
+}
+
+// Price for a route via the ledger. Returns { price, source } where source
+// is 'ledger' (reused), 'serpapi' (fetched and published) or 'busy' (another
+// poller is fetching it right now; price is null and the next run picks it
+// up). Ledger errors fall back to a plain fetch.
+export async function getRoutePrice(origin, destination, date, currency = 'USD') {
+  origin = origin.toUpperCase()
+  destination = destination.toUpperCase()
+  const owner = newOwner()
+
+  let claim
+  try {
+    claim = await claimRoute(owner, origin, destination, date, currency)
+  } catch (error) {
+    console.error('Route ledger claim error:', error)
+    const quote = await getFlightQuote(origin, destination, date, currency)
+    return { price: quote ? quote.price : null, source: 'serpapi' }
+  }
+
+  if (claim.quote) {
+    return { price: claim.quote.price, source: 'ledger' }
+  }
+  if (claim.busy) {
+    return { price: null, source: 'busy' }
+  }
+
+  const quote = await getFlightQuote(origin, destination, date, currency)
+  try {
+    if (quote) {
+      await publishQuote(owner, quote)
+    } else {
+      await releaseRoute(owner, origin, destination, date, currency)
+    }
+  } catch (error) {
+    console.error('Route ledger update error:', error)
+  }
+  return { price: quote ? quote.price : null, source: 'serpapi' }
+}
@@ -1,5 +1,5 @@
 import prisma from '../../../lib/prisma'
-import { getFlightPrice } from '../../../lib/flights'
+import { getRoutePrice } from '../../../lib/routeLedger'
 import { sendPriceAlert } from '../../../lib/email'
 
 export default async function handler(req, res) {
@@ -18,13 +18,21 @@ export default async function handler(req, res) {
 
   let checked = 0
   let notified = 0
+  const sources = { ledger: 0, serpapi: 0, busy: 0 }
+
+  // Alerts on the same route share one lookup; the shared ledger also
+  // reuses routes the Discord bot fetched recently
+  const routes = new Map()
 
   for (const alert of alerts) {
-    const price = await getFlightPrice(
-      alert.origin,
-      alert.destination,
-      alert.departureDate.toISOString().split('T')[0]
-    )
+    const date = alert.departureDate.toISOString().split('T')[0]
+    const key = `${alert.origin.toUpperCase()}|${alert.destination.toUpperCase()}|${date}`
+    if (!routes.has(key)) {
+      const result = await getRoutePrice(alert.origin, alert.destination, date)
+      sources[result.source]++
+      routes.set(key, result.price)
+    }
+    const price = routes.get(key)
 
     if (!price) continue
     checked++
@@ -74,5 +82,8 @@ export default async function handler(req, res) {
     success: true,
     alertsChecked: checked,
     notificationsSent: notified,
+    routesFromLedger: sources.ledger,
+    routesFetched: sources.serpapi,
+    routesBusy: sources.busy,
   })
 }
@@ -0,0 +1,51 @@
+-- Indexes for the Discord bot's hot queries.
+--
+-- The plain indexes match the @@index/@unique entries in schema.prisma
+-- (same names), so `npx prisma db push` creates them too; they are repeated
+-- here so the file works on its own, e.g. for bot/bench/bench_queries.py.
+-- The partial indexes can't be expressed in the Prisma schema. `db push`
+-- may drop them, so re-apply this file after each push:
+--
+--   npx prisma db execute --file prisma/sql/bot_indexes.sql --schema prisma/schema.prisma
+
+-- get_or_create_user: lookup by Discord ID
+CREATE UNIQUE INDEX IF NOT EXISTS "User_discordId_key" ON "User" ("discordId");
+
+-- get_user_alerts: WHERE "userId" = ? AND "isActive" ORDER BY "createdAt" DESC
+CREATE INDEX IF NOT EXISTS "Alert_userId_isActive_createdAt_idx"
+    ON "Alert" ("userId", "isActive", "createdAt" DESC);
+
+-- get_user_alerts_page: keyset pages of a user's active alerts, newest first
+CREATE INDEX IF NOT EXISTS "Alert_active_userId_createdAt_id_partial_idx"
+    ON "Alert" ("userId", "createdAt" DESC, id DESC) WHERE "isActive";
+
+-- find_user_alerts: WHERE "userId" = ? AND "isActive" AND id LIKE 'prefix%'
+-- (text_pattern_ops so LIKE can use the index under any collation)
+CREATE INDEX IF NOT EXISTS "Alert_active_userId_id_partial_idx"
+    ON "Alert" ("userId", id text_pattern_ops) WHERE "isActive";
+
+-- get_all_active_alerts: WHERE "isActive" AND "departureDate" >= CURRENT_DATE
+-- (and deactivate_expired_alerts: "departureDate" < CURRENT_DATE)
+CREATE INDEX IF NOT EXISTS "Alert_active_departureDate_partial_idx"
+    ON "Alert" ("departureDate") WHERE "isActive";
+
+-- iter_active_alerts: keyset pages of active alerts ordered by id
+CREATE INDEX IF NOT EXISTS "Alert_active_id_partial_idx" ON "Alert" (id) WHERE "isActive";
+
+-- claim_due_alerts: due active alerts ordered by "nextCheckAt" NULLS FIRST
+CREATE INDEX IF NOT EXISTS "Alert_active_nextCheckAt_partial_idx"
+    ON "Alert" ("nextCheckAt" NULLS FIRST) WHERE "isActive";
+
+-- Per-alert history (volatility, trends) and time-window scans
+CREATE INDEX IF NOT EXISTS "PriceHistory_alertId_checkedAt_idx" ON "PriceHistory" ("alertId", "checkedAt");
+CREATE INDEX IF NOT EXISTS "PriceHistory_checkedAt_idx" ON "PriceHistory" ("checkedAt");
+
+-- Full-table versions of the partial indexes above, created by earlier
+-- schemas. "nextCheckAt" changes on every check, so each extra index on it
+-- costs a write per checked alert.
+DROP INDEX IF EXISTS "Alert_isActive_departureDate_idx";
+DROP INDEX IF EXISTS "Alert_isActive_nextCheckAt_idx";
+
+ANALYZE "User";
+ANALYZE "Alert";
+ANALYZE "PriceHistory";
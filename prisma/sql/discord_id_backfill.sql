@@ -0,0 +1,10 @@
+-- Copy Discord IDs out of the legacy "discord:<id>" name convention into
+-- the "discordId" column. Run once after `npx prisma db push` adds the column:
+--
+--   npx prisma db execute --file prisma/sql/discord_id_backfill.sql --schema prisma/schema.prisma
+--
+-- The bot also backfills users lazily the next time they run a command.
+
+UPDATE "User"
+SET "discordId" = substring(name FROM 9)
+WHERE name LIKE 'discord:%' AND "discordId" IS NULL;
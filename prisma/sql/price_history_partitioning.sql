@@ -0,0 +1,58 @@
+-- Convert "PriceHistory" into a table range-partitioned by month on "checkedAt".
+--
+-- Run once, after `npx prisma db push` has created "PriceHistoryDaily" and
+-- the ("id", "checkedAt") primary key, and while the bot and the web cron
+-- are stopped:
+--
+--   npx prisma db execute --file prisma/sql/price_history_partitioning.sql --schema prisma/schema.prisma
+--
+-- After this, the bot's maintenance job (bot/retention.py) creates upcoming
+-- monthly partitions, rolls raw rows past PRICE_HISTORY_RETENTION_DAYS into
+-- "PriceHistoryDaily", and drops expired partitions whole. Don't run
+-- `prisma db push` against PriceHistory afterwards. Prisma can't represent
+-- partitioning and would try to recreate the table.
+
+BEGIN;
+
+ALTER TABLE "PriceHistory" RENAME TO "PriceHistory_legacy";
+ALTER INDEX "PriceHistory_pkey" RENAME TO "PriceHistory_legacy_pkey";
+DROP INDEX IF EXISTS "PriceHistory_alertId_checkedAt_idx";
+DROP INDEX IF EXISTS "PriceHistory_checkedAt_idx";
+
+CREATE TABLE "PriceHistory" (
+    "id"        TEXT NOT NULL,
+    "alertId"   TEXT NOT NULL,
+    "price"     DOUBLE PRECISION NOT NULL,
+    "checkedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT "PriceHistory_pkey" PRIMARY KEY ("id", "checkedAt")
+) PARTITION BY RANGE ("checkedAt");
+
+CREATE INDEX "PriceHistory_alertId_checkedAt_idx" ON "PriceHistory" ("alertId", "checkedAt");
+CREATE INDEX "PriceHistory_checkedAt_idx" ON "PriceHistory" ("checkedAt");
+
+-- Catches rows outside every monthly partition; should stay empty
+CREATE TABLE "PriceHistory_default" PARTITION OF "PriceHistory" DEFAULT;
+
+-- Monthly partitions covering existing data through three months ahead
+DO $$
+DECLARE
+    month_start DATE := date_trunc('month', COALESCE((SELECT min("checkedAt") FROM "PriceHistory_legacy"), now()))::date;
+    last_month  DATE := (date_trunc('month', now()) + INTERVAL '3 months')::date;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF "PriceHistory" FOR VALUES FROM (%L) TO (%L)',
+            'PriceHistory_p' || to_char(month_start, 'YYYYMM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::date
+        );
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO "PriceHistory" SELECT "id", "alertId", "price", "checkedAt" FROM "PriceHistory_legacy";
+DROP TABLE "PriceHistory_legacy";
+
+COMMIT;
+
+ANALYZE "PriceHistory";